@@ -0,0 +1,125 @@
+import json
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only used to advance the clocks in one vectorized pass
+    np = None
+
+
+class AnimationData:
+
+    def __init__(self, filename: str) -> None:
+        '''Frame tables of a spritesheet loaded from its Aseprite json export (hash or array
+        frames, per-frame "duration" in ms and "frameTags" with forward, reverse or pingpong
+        direction). Every tag is baked into a timeline with one spritesheet texture index per
+        millisecond, so finding the frame of an animation is a single lookup.'''
+
+        with open(filename) as json_file:
+            data = json.load(json_file)
+
+        '''SPRITESHEET TEXTURE INDEX AND DURATION OF EVERY FRAME'''
+        frames = data['frames'] if isinstance(data['frames'], list) else list(data['frames'].values())
+        n_cols = data['meta']['size']['w'] // frames[0]['frame']['w']
+        indices = [(frame['frame']['y'] // frame['frame']['h']) * n_cols + frame['frame']['x'] // frame['frame']['w']
+                   for frame in frames]
+        durations = [max(int(frame['duration']), 1) for frame in frames]
+
+        '''TAG TIMELINES (THE WHOLE SHEET IS ALSO AVAILABLE AS THE "" TAG)'''
+        tags = data['meta'].get('frameTags', []) + [{'name': '', 'from': 0, 'to': len(frames) - 1}]
+        self.timelines = {}
+        for tag in tags:
+            order = list(range(tag['from'], tag['to'] + 1))
+            direction = tag.get('direction', 'forward')
+            if direction == 'reverse':
+                order.reverse()
+            elif direction == 'pingpong':
+                order += order[-2:0:-1]
+            self.timelines[tag['name']] = array('H', [indices[i] for i in order for _ in range(durations[i])])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(timeline) * timeline.itemsize for timeline in self.timelines.values())
+
+
+class AnimationClocks:
+
+    def __init__(self) -> None:
+        '''Playback clocks (in ms) and speeds of every animator, kept in two flat buffers so
+        advance updates all of them in one pass.'''
+
+        self.times = array('d')
+        self.speeds = array('d')
+        self._free = []
+
+    def add(self) -> int:
+        '''Returns a free clock slot.'''
+
+        if self._free:
+            return self._free.pop()
+        self.times.append(0.0)
+        self.speeds.append(0.0)
+        return len(self.times) - 1
+
+    def remove(self, slot: int) -> None:
+        self.speeds[slot] = 0.0
+        self._free.append(slot)
+
+    def advance(self, dt: float) -> None:
+        '''Advances every clock by dt seconds times its speed.'''
+
+        if np is not None:
+            times = np.frombuffer(self.times, dtype=np.float64)
+            times += np.frombuffer(self.speeds, dtype=np.float64) * (dt * 1000)
+        else:
+            times, speeds, dt = self.times, self.speeds, dt * 1000
+            for i in range(len(times)):
+                times[i] += speeds[i] * dt
+
+
+class Animator:
+
+    __slots__ = ('clocks', 'slot', 'data', 'tag', 'loop', '_timeline')
+
+    def __init__(self, clocks: AnimationClocks = None) -> None:
+        '''Plays one animation at a time, driven by a clock of the shared AnimationClocks (so
+        it runs at the same speed at any frame rate).'''
+
+        self.clocks = clocks if clocks is not None else animation_clocks
+        self.slot = self.clocks.add()
+        self.data = None
+        self.tag = None
+        self.loop = True
+        self._timeline = None
+
+    def play(self, data: AnimationData, tag: str, speed: float = 1.0, loop: bool = True) -> None:
+        '''Starts an animation (a tag of data) from its first frame. If it is already playing,
+        only its speed is updated.'''
+
+        if data is not self.data or tag != self.tag:
+            self.data, self.tag, self.loop = data, tag, loop
+            self._timeline = data.timelines[tag]
+            self.clocks.times[self.slot] = 0.0
+        self.clocks.speeds[self.slot] = speed
+
+    @property
+    def frame(self) -> int:
+        '''Spritesheet texture index of the current frame.'''
+
+        timeline, time = self._timeline, int(self.clocks.times[self.slot])
+        if self.loop:
+            return timeline[time % len(timeline)]
+        return timeline[min(time, len(timeline) - 1)]
+
+    @property
+    def finished(self) -> bool:
+        '''Whether a non looping animation has played its last frame.'''
+
+        return not self.loop and self.clocks.times[self.slot] >= len(self._timeline)
+
+    def release(self) -> None:
+        self.clocks.remove(self.slot)
+
+
+'''SHARED ANIMATION CLOCKS (ADVANCED ONCE PER SIMULATION STEP BY THE GAME)'''
+animation_clocks = AnimationClocks()
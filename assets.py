@@ -0,0 +1,102 @@
+import pygame
+from collections import OrderedDict
+from texture import SpriteSheet
+from animation import AnimationData
+
+
+class AssetManager:
+
+    def __init__(self, memory_budget: int = 64 * 2**20) -> None:
+        '''Shared store for loaded (and scaled) spritesheets, images and animations, so entities
+        and levels using the same file never read or rescale it again. Assets are reference
+        counted: every acquire (spritesheet/image/animation) must be paired with a release.
+        Released assets stay cached and are evicted, least recently used first, only while the
+        cache is above memory_budget (bytes). Assets still in use are never evicted.'''
+
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._entries = OrderedDict()  # key -> [asset, reference count, size in bytes]
+        self._keys = {}                # id(asset) -> key
+
+    def spritesheet(self,
+                    filename: str,
+                    tile_size: tuple[int, int],
+                    scale: int,
+                    dimension: tuple[int, int],
+                    flippable: bool = False,
+                    alpha: bool = False,
+                    atlas: pygame.Surface = None) -> SpriteSheet:
+        '''Acquires a spritesheet (see SpriteSheet for the arguments). atlas is only used if
+        the sheet is not loaded yet.'''
+
+        key = ('spritesheet', filename, tuple(tile_size), scale, tuple(dimension), flippable, alpha)
+        return self._acquire(key, lambda: SpriteSheet(filename=filename,
+                                                      tile_size=tile_size,
+                                                      scale=scale,
+                                                      dimension=dimension,
+                                                      flippable=flippable,
+                                                      atlas=atlas,
+                                                      alpha=alpha))
+
+    def image(self, filename: str, size: tuple[int, int] = None, surface: pygame.Surface = None) -> pygame.Surface:
+        '''Acquires an image converted to the display format, scaled to size if given.
+        surface (the image already read and scaled) is only used if it is not loaded yet.'''
+
+        def load():
+            if surface is not None:
+                return surface.convert()
+            image = pygame.image.load(filename).convert()
+            return pygame.transform.scale(image, size) if size is not None else image
+
+        return self._acquire(('image', filename, tuple(size) if size else None), load)
+
+    def animation(self, filename: str) -> AnimationData:
+        '''Acquires the animation frame tables of an Aseprite json export.'''
+
+        return self._acquire(('animation', filename), lambda: AnimationData(filename))
+
+    def release(self, asset) -> None:
+        '''Releases an acquired asset. It is kept cached until evicted by the memory budget.'''
+
+        entry = self._entries[self._keys[id(asset)]]
+        entry[1] -= 1
+        self._evict()
+
+    def _acquire(self, key: tuple, load):
+        entry = self._entries.get(key)
+        if entry is None:
+            asset = load()
+            entry = [asset, 0, AssetManager._size_of(asset)]
+            self._entries[key] = entry
+            self._keys[id(asset)] = key
+            self.memory_used += entry[2]
+        self._entries.move_to_end(key)
+        entry[1] += 1
+        self._evict()
+        return entry[0]
+
+    def _evict(self) -> None:
+        '''Drops unused assets (least recently used first) while above the memory budget.'''
+
+        if self.memory_used <= self.memory_budget:
+            return
+        for key in [key for key, entry in self._entries.items() if entry[1] == 0]:
+            asset, _, size = self._entries.pop(key)
+            del self._keys[id(asset)]
+            self.memory_used -= size
+            if self.memory_used <= self.memory_budget:
+                return
+
+    @staticmethod
+    def _size_of(asset) -> int:
+        '''Approximate pixel (or frame table) memory of an asset in bytes.'''
+
+        if isinstance(asset, AnimationData):
+            return asset.nbytes
+        surfaces = [asset] if isinstance(asset, pygame.Surface) else [asset.atlas, asset.flipped_atlas]
+        return sum(surface.get_width() * surface.get_height() * surface.get_bytesize()
+                   for surface in surfaces if surface is not None)
+
+
+'''SHARED ASSET MANAGER (THE MEMORY BUDGET IS SET FROM THE SETTINGS BY THE GAME)'''
+assets = AssetManager()
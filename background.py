@@ -0,0 +1,106 @@
+import pygame
+from assets import assets
+
+
+class BackgroundLayer:
+
+    def __init__(self,
+                 image: pygame.Surface,
+                 scroll: tuple[float, float] = (0.0, 0.0),
+                 repeat: tuple[bool, bool] = (False, False),
+                 offset: tuple[int, int] = (0, 0)) -> None:
+        '''One background image drawn behind the level. scroll is the fraction of the camera
+        movement the layer follows (0 is a fixed backdrop, 1 moves with the tiles, values in
+        between give parallax). A repeated axis tiles the image over the whole screen.'''
+
+        self.image = image
+        self.scroll = scroll
+        self.repeat = repeat
+        self.offset = offset
+
+    def render(self, screen, camera, area: pygame.Rect) -> None:
+        '''Blits only the copies of the image that intersect the screen area.'''
+
+        width, height = self.image.get_size()
+        x = self.offset[0] - int(camera.offset.x * self.scroll[0])
+        y = self.offset[1] - int(camera.offset.y * self.scroll[1])
+
+        '''FIRST AND LAST COPIES OF THE IMAGE OVER THE AREA (ONLY ONE IF NOT REPEATED)'''
+        if self.repeat[0]:
+            first_x = x + (area.left - x) // width * width
+            xs = range(first_x, area.right, width)
+        else:
+            xs = (x,) if x < area.right and x + width > area.left else ()
+        if self.repeat[1]:
+            first_y = y + (area.top - y) // height * height
+            ys = range(first_y, area.bottom, height)
+        else:
+            ys = (y,) if y < area.bottom and y + height > area.top else ()
+
+        for copy_y in ys:
+            for copy_x in xs:
+                screen.blit(self.image, (copy_x, copy_y))
+
+
+class Background:
+
+    def __init__(self, config: dict, level_name: str, images: list = None) -> None:
+        '''Parallax background of a level, made of the layers in its "backgrounds" list (drawn
+        in order), e.g. {"image": "bg.png", "size": [1536, 864], "scroll": [0.5, 0.5],
+        "repeat": [true, false], "offset": [0, 0]} (size defaults to the image file size). Every
+        image is kept at its own size, so memory does not depend on the level size. Levels
+        with only a "bg" image get a single screen sized backdrop that does not scroll.
+        images are the layer images returned by Background.prepare (read here if not given).'''
+
+        level = config[level_name]
+        self.screen_size = Background._screen_size(config)
+        self.layers = []
+        settings = level['backgrounds'] if 'backgrounds' in level else [{}]
+        for i, (filename, size) in enumerate(Background._images(config, level_name)):
+            layer = settings[i]
+            image = assets.image(filename, size=size, surface=images[i] if images is not None else None)
+            self.layers.append(BackgroundLayer(image=image,
+                                               scroll=tuple(layer.get('scroll', (0.0, 0.0))),
+                                               repeat=tuple(layer.get('repeat', (False, False))),
+                                               offset=tuple(layer.get('offset', (0, 0)))))
+
+    @staticmethod
+    def prepare(config: dict, level_name: str) -> list:
+        '''Reads and scales the layer images, without converting them to the display format
+        (so it can run on a worker thread, see loader.py).'''
+
+        images = []
+        for filename, size in Background._images(config, level_name):
+            image = pygame.image.load(filename)
+            images.append(pygame.transform.scale(image, size) if size is not None else image)
+        return images
+
+    def render(self, screen, camera, area: pygame.Rect = None) -> None:
+        '''Renders every layer over the screen area (the whole screen if area is None).'''
+
+        if area is None:
+            area = pygame.Rect((0, 0), self.screen_size)
+        for layer in self.layers:
+            layer.render(screen, camera, area)
+
+    def release(self) -> None:
+        '''Releases the shared layer images.'''
+
+        for layer in self.layers:
+            assets.release(layer.image)
+        self.layers = []
+
+    @staticmethod
+    def _images(config: dict, level_name: str) -> list:
+        '''Returns the (file name, size or None) of the image of every layer.'''
+
+        level = config[level_name]
+        if 'backgrounds' not in level:
+            return [(level['bg'], Background._screen_size(config))]
+        return [(layer['image'], tuple(layer['size']) if 'size' in layer else None) for layer in level['backgrounds']]
+
+    @staticmethod
+    def _screen_size(config: dict) -> tuple:
+        display = config['display']
+        return (display['base-size'] * display['scale'] * config['game']['ntiles_width'],
+                display['base-size'] * display['scale'] * config['game']['ntiles_height'])
@@ -0,0 +1,158 @@
+import pygame
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+LEVEL_SIZES = [(16, 9), (64, 16), (250, 50), (1000, 100)]
+ENTITY_COUNTS = [1, 10, 100, 500]
+
+
+def make_level_csv(filename: str, n_cols: int, n_rows: int, seed: int = 0) -> None:
+    '''Writes a synthetic level layout: a two tiles thick floor plus random floating platforms
+    (tile ids taken from tileset-joel-planet).'''
+
+    rng = random.Random(seed)
+    grid = [[-1] * n_cols for _ in range(n_rows)]
+    for col in range(n_cols):
+        grid[n_rows - 2][col] = 1
+        grid[n_rows - 1][col] = 4
+    for _ in range(n_cols * n_rows // 40):
+        row, col, length = rng.randrange(2, max(n_rows - 3, 3)), rng.randrange(n_cols), rng.randrange(2, 8)
+        for j in range(col, min(col + length, n_cols)):
+            grid[row][j] = 3
+
+    with open(filename, 'w') as data:
+        for row in grid:
+            data.write(','.join(str(cell) for cell in row) + '\n')
+
+
+def make_config(config: dict, csv_filename: str, n_cols: int, n_rows: int, physics: str, streaming: bool) -> dict:
+    '''Returns a copy of the game settings with a "bench" level built like level-test. Streaming
+    levels keep their chunked file next to the csv file, the others are never cached.'''
+
+    config = copy.deepcopy(config)
+    config['game']['level-cache'] = os.path.dirname(csv_filename) if streaming else None
+    config['game']['physics-backend'] = physics
+    config['bench'] = copy.deepcopy(config['level-test'])
+    config['bench']['name'] = f'bench {n_cols}x{n_rows}'
+    config['bench']['size_in_tiles'] = [n_cols, n_rows]
+    config['bench']['layers'][0]['mapping'] = csv_filename
+    config['bench']['streaming'] = streaming
+    return config
+
+
+def build_game(config: dict, n_entities: int, seed: int = 0):
+    '''Creates a headless game on the bench level with Joel plus n_entities - 1 Kittols
+    spread over the level. Returns the game and the level load time.'''
+
+    from game import Game
+    from player import Kittol
+
+    game = Game(config=config, headless=True)
+    game.load_map(level_name='bench', render_bg=False)
+
+    rng = random.Random(seed)
+    width = game.level.n_cols * game.level.tile_size
+    for _ in range(n_entities - 1):
+        game.spawn(Kittol(config, init_x=rng.randrange(0, width - game.level.tile_size), init_y=0))
+    return game, game.level.load_time
+
+
+def run_case(config: dict, n_cols: int, n_rows: int, n_entities: int, n_frames: int, physics: str,
+             streaming: bool) -> dict:
+    '''Runs one benchmark case (meant to run in its own process, so the peak memory is the
+    case's own) and returns its results.'''
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_filename = os.path.join(tmp_dir, 'bench.csv')
+        make_level_csv(csv_filename, n_cols, n_rows)
+        config = make_config(config, csv_filename, n_cols, n_rows, physics, streaming)
+        game, load_time = build_game(config, n_entities)
+
+        '''KEEP JOEL RUNNING RIGHT SO THE PLAYER PATH IS EXERCISED TOO'''
+        game.player.control(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RIGHT))
+
+        update_times, render_times = [], []
+        for frame in range(n_frames + 10):
+            start = time.perf_counter()
+            game.update()
+            middle = time.perf_counter()
+            game.render()
+            end = time.perf_counter()
+            if frame >= 10:  # warm up
+                update_times.append(middle - start)
+                render_times.append(end - middle)
+        game.level.unload()
+
+    '''PEAK MEMORY (ru_maxrss IS IN BYTES ON MACOS, IN KILOBYTES ELSEWHERE)'''
+    rss_scale = 1 if sys.platform == 'darwin' else 1024
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale if resource else None
+    return {'level_size': [n_cols, n_rows],
+            'entities': n_entities,
+            'physics': physics,
+            'streaming': streaming,
+            'frames': n_frames,
+            'load_ms': load_time * 1000,
+            'update_ms_mean': statistics.fmean(update_times) * 1000,
+            'update_ms_p95': _percentile(update_times, 0.95) * 1000,
+            'render_ms_mean': statistics.fmean(render_times) * 1000,
+            'render_ms_p95': _percentile(render_times, 0.95) * 1000,
+            'peak_memory_bytes': peak_memory}
+
+
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def main() -> None:
+    '''Runs every (level size, entity count) case, prints a table and saves the results as json.'''
+
+    parser = argparse.ArgumentParser(description='Joel the Squid update/render benchmarks')
+    parser.add_argument('--sizes', nargs='+', default=[f'{w}x{h}' for w, h in LEVEL_SIZES],
+                        help='level sizes in tiles, e.g. 16x9 1000x100')
+    parser.add_argument('--entities', nargs='+', type=int, default=ENTITY_COUNTS)
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--physics', choices=['scalar', 'numpy'], default='scalar', help='physics backend')
+    parser.add_argument('--streaming', action='store_true', help='load the levels as streaming levels')
+    parser.add_argument('--out', default='bench_results.json')
+    args = parser.parse_args()
+
+    with open("settings.json") as json_file:
+        config = json.load(json_file)
+
+    results = []
+    print(f'{"level":>10} {"entities":>8} {"load ms":>9} {"update ms":>10} {"render ms":>10} {"peak MB":>8}')
+    for size in args.sizes:
+        n_cols, n_rows = (int(n) for n in size.split('x'))
+        for n_entities in args.entities:
+
+            '''ONE FRESH PROCESS PER CASE (PEAK MEMORY AND CACHES DO NOT LEAK BETWEEN CASES)'''
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, config, n_cols, n_rows, n_entities,
+                                         args.frames, args.physics, args.streaming).result()
+            results.append(result)
+            peak = f'{result["peak_memory_bytes"] / 2**20:.0f}' if result['peak_memory_bytes'] else '-'
+            print(f'{size:>10} {n_entities:>8} {result["load_ms"]:>9.1f} {result["update_ms_mean"]:>10.3f} '
+                  f'{result["render_ms_mean"]:>10.3f} {peak:>8}')
+
+    with open(args.out, 'w') as json_file:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, json_file, indent=2)
+    print(f'results saved to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
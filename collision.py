@@ -0,0 +1,173 @@
+import pygame
+import heapq
+
+
+class SpatialGrid:
+
+    def __init__(self, cell_size: int, colliders: list = ()) -> None:
+        '''Creates a uniform grid that buckets colliders (any object with a pygame rect
+        in its "rect" attribute) by the cells their rects overlap. Queries only look at the
+        cells touched by the given rect, so their cost does not depend on the level size.'''
+
+        self.cell_size = cell_size
+        self._cells = {}
+        for collider in colliders:
+            self.insert(collider)
+
+    def insert(self, collider) -> None:
+        '''Adds a collider to every cell its rect overlaps.'''
+
+        for cell in self._cells_in_rect(collider.rect):
+            self._cells.setdefault(cell, []).append(collider)
+
+    def remove(self, collider) -> None:
+        '''Removes a collider from every cell its rect overlaps.'''
+
+        for cell in self._cells_in_rect(collider.rect):
+            bucket = self._cells.get(cell)
+            if bucket is not None and collider in bucket:
+                bucket.remove(collider)
+                if not bucket:
+                    del self._cells[cell]
+
+    def query(self, rect: pygame.Rect) -> list:
+        '''Returns the colliders stored in the cells overlapped by rect (candidates only,
+        the caller still has to test them). Each collider is returned once.'''
+
+        cells = self._cells
+        candidates = []
+        for cell in self._cells_in_rect(rect):
+            bucket = cells.get(cell)
+            if bucket is not None:
+                for collider in bucket:
+                    if collider not in candidates:
+                        candidates.append(collider)
+        return candidates
+
+    def _cells_in_rect(self, rect: pygame.Rect):
+        '''Yields the (column, row) cells overlapped by rect.'''
+
+        size = self.cell_size
+        first_col, last_col = rect.left // size, (rect.right - 1) // size
+        first_row, last_row = rect.top // size, (rect.bottom - 1) // size
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                yield col, row
+
+
+def sweep_and_prune(query_rects: list, target_rects: list):
+    '''Broadphase for rect vs rect collisions. Sorts both rect lists by their left edge and
+    sweeps them on the x axis, only testing rects whose x intervals are open at the same time.
+    The open intervals are kept in heaps ordered by their right edge, so the ended ones are
+    dropped from the front. Yields the (query index, target index) pairs whose rects actually
+    overlap.'''
+
+    rects = (query_rects, target_rects)
+    events = sorted([(rect.left, 0, i) for i, rect in enumerate(query_rects)]
+                    + [(rect.left, 1, j) for j, rect in enumerate(target_rects)])
+    active = ([], [])
+
+    for left, kind, index in events:
+        rect = rects[kind][index]
+        other_rects = rects[1 - kind]
+        other_active = active[1 - kind]
+
+        '''CLOSE INTERVALS THAT ENDED BEFORE THIS ONE STARTS'''
+        while other_active and other_active[0][0] <= left:
+            heapq.heappop(other_active)
+
+        for _, k in other_active:
+            if rect.colliderect(other_rects[k]):
+                yield (index, k) if kind == 0 else (k, index)
+        heapq.heappush(active[kind], (rect.right, index))
+
+
+class Collider:
+
+    __slots__ = ('rect',)
+
+    def __init__(self, rect: pygame.Rect) -> None:
+        '''Solid axis aligned box used by the physics (built from merged solid tiles).'''
+
+        self.rect = rect
+
+
+def merge_solid_cells(grid, n_cols: int, n_rows: int, cell_size: int,
+                      region: tuple[int, int, int, int] = None, max_span: int = None) -> list:
+    '''Greedy meshing of a packed tile grid (row major, -1 for empty cells): merges the solid
+    cells into few axis aligned colliders. Each unvisited solid cell (row major order) is grown
+    to the right as far as possible, then down while the whole span is solid. region is an
+    optional (col, row, n_cols, n_rows) part of the grid to merge, colliders never cross it.
+    max_span optionally caps the width and height of the colliders (in cells).'''
+
+    first_col, first_row, width, height = region if region is not None else (0, 0, n_cols, n_rows)
+    max_span = max_span or max(width, height)
+    visited = bytearray(width * height)
+    colliders = []
+
+    for i in range(height):
+        for j in range(width):
+            if visited[i*width + j] or grid[(first_row + i)*n_cols + first_col + j] == -1:
+                continue
+
+            '''GROW TO THE RIGHT'''
+            span = 1
+            while (j + span < width and span < max_span and not visited[i*width + j + span]
+                   and grid[(first_row + i)*n_cols + first_col + j + span] != -1):
+                span += 1
+
+            '''GROW DOWN WHILE THE WHOLE SPAN IS SOLID'''
+            rows = 1
+            while i + rows < height and rows < max_span and all(
+                    not visited[(i + rows)*width + k] and grid[(first_row + i + rows)*n_cols + first_col + k] != -1
+                    for k in range(j, j + span)):
+                rows += 1
+
+            for r in range(i, i + rows):
+                visited[r*width + j:r*width + j + span] = b'\x01' * span
+            colliders.append(Collider(pygame.Rect((first_col + j) * cell_size, (first_row + i) * cell_size,
+                                                  span * cell_size, rows * cell_size)))
+
+    return colliders
+
+
+def sweep_rect(rect: pygame.Rect, dx: float, dy: float, colliders: list) -> tuple:
+    '''Swept AABB test: moves rect by (dx, dy) and finds the first collider it enters. Returns
+    (time of impact as a fraction of the motion in [0, 1), collider, normal) or (1.0, None,
+    None) if the whole motion is free. A collider that rect only touches at the end of the
+    motion is not hit, and colliders already overlapping rect at the start are ignored. Pass
+    only the candidates returned by the collision grid for the swept box (the union of rect at
+    the start and at the end of the motion).'''
+
+    inf = float('inf')
+    best_time, best, best_normal = 1.0, None, None
+    for collider in colliders:
+        other = collider.rect
+
+        '''ENTRY AND EXIT TIMES ON EACH AXIS (A STILL AXIS MUST ALREADY OVERLAP)'''
+        if dx > 0:
+            x_entry, x_exit = (other.left - rect.right) / dx, (other.right - rect.left) / dx
+        elif dx < 0:
+            x_entry, x_exit = (other.right - rect.left) / dx, (other.left - rect.right) / dx
+        elif rect.left < other.right and rect.right > other.left:
+            x_entry, x_exit = -inf, inf
+        else:
+            continue
+        if dy > 0:
+            y_entry, y_exit = (other.top - rect.bottom) / dy, (other.bottom - rect.top) / dy
+        elif dy < 0:
+            y_entry, y_exit = (other.bottom - rect.top) / dy, (other.top - rect.bottom) / dy
+        elif rect.top < other.bottom and rect.bottom > other.top:
+            y_entry, y_exit = -inf, inf
+        else:
+            continue
+
+        entry = max(x_entry, y_entry)
+        if 0 <= entry < best_time and entry < min(x_exit, y_exit):
+            best_time, best = entry, collider
+            if x_entry >= y_entry:
+                best_normal = (-1 if dx > 0 else 1, 0)
+            else:
+                best_normal = (0, -1 if dy > 0 else 1)
+
+    return best_time, best, best_normal
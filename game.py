@@ -1,18 +1,29 @@
 
 
 import pygame
+import os
 from pygame.locals import *
 from player import *
-from level import Level
+from loader import LevelLoader
 from camera import Camera
+from collision import sweep_and_prune
+from physics import BatchPhysics
+from scheduler import EntityScheduler
+from profiler import profiler
+from latency import latency
+from renderer import DirtyRectRenderer
+from assets import assets
+from animation import animation_clocks
+from particles import particles
 
 
 class Game:
 
-    def __init__(self, config: dict) -> None:
+    def __init__(self, config: dict, headless: bool = False) -> None:
         '''Create the main game instance that controls the flow of the game,
         such as: player and enemies construction, map contruction, update calls, and render
-        to the screen.'''
+        to the screen. A headless game uses the SDL dummy video driver, so no window is opened
+        (textures can still be converted) and it can be updated faster than real time.'''
 
         '''INIT SETUP'''
         self.config:       dict = config
@@ -23,49 +34,139 @@ class Game:
         self.height:       int  = self.base_size * self.scale * config["game"]["ntiles_height"]
 
         '''CREATE MAIN SCREEN'''
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
         self.display_resolution = (self.width, self.height)
         self.screen = pygame.display.set_mode(self.display_resolution)
         pygame.display.set_caption(self.name)
 
-        '''SET GAME FPS AND DT (TIME INTERVAL IN PHYSICS CALCULATION)'''
+        '''RENDERER ("full" REDRAWS AND FLIPS THE WHOLE SCREEN EVERY FRAME, "dirty" ONLY UPDATES
+        THE REGIONS THAT CHANGED, SEE renderer.DirtyRectRenderer)'''
+        self.renderer = None
+        if config["game"]["renderer"] == "dirty":
+            self.renderer = DirtyRectRenderer(self.screen)
+
+        '''SET SIMULATION RATE (FPS) AND DT (TIME INTERVAL IN PHYSICS CALCULATION).
+        THE PHYSICS RUNS AT A FIXED STEP OF 1/FPS SECONDS (DT = 1), RENDERING RUNS AT RENDER-FPS
+        (0 FOR UNCAPPED) AND INTERPOLATES BETWEEN THE LAST TWO SIMULATION STEPS'''
         self.fps = config["game"]["fps"]
+        self.render_fps = config["game"]["render-fps"]
+        self.max_steps_per_frame = config["game"]["max-steps-per-frame"]
         self.clock = pygame.time.Clock()
-        self.dt = self.clock.tick(self.fps) * 0.001 * self.fps
+        self.step_time = 1 / self.fps
+        self.dt = 1.0
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.step_count = 0
+
+        '''INPUT POLLING ("frame" DRAINS THE EVENTS ONCE PER FRAME, RIGHT AFTER THE FRAME RATE WAIT,
+        "step" DRAINS THEM RIGHT BEFORE EVERY SIMULATION STEP, SEE advance)'''
+        self.poll_input_per_step = config["game"]["input-polling"] == "step"
+
+        '''INPUT RECORDING (SEE replay.InputRecorder)'''
+        self.recorder = None
+
+        '''FRAME PROFILER TRACE FILE (F3 TOGGLES THE PROFILER OVERLAY, F4 SAVES THE TRACE, ALSO
+        SAVED ON QUIT WHEN SET, SEE --profile)'''
+        self.profile_filename = None
+
+        '''INPUT LATENCY TRACE FILE (SAVED ON QUIT WHEN THE LATENCY TRACKER IS ENABLED)'''
+        self.latency_filename = 'latency.csv'
 
         '''CAMERA SETUP'''
         self.target_player = None
 
         '''ENTITIES CONTROL'''
         self.group = []
+        self.batch_physics = None
+        self.scheduler = None
+        self.level = None
+
+        '''BACKGROUND LEVEL LOADING (THE BUILD OF A LOADED LEVEL RUNS FOR UP TO LOAD-SLICE-MS PER FRAME)'''
+        self.loader = LevelLoader()
+        self.next_level = None
+        self.load_slice = config["game"]["load-slice-ms"] * 0.001
+
+        '''SHARED ASSETS MEMORY BUDGET (UNUSED SPRITESHEETS AND IMAGES ARE KEPT UP TO IT)'''
+        assets.memory_budget = config["game"]["asset-budget-mb"] * 2**20
+
+        '''PARTICLE POOL (0 DISABLES THE PARTICLE EFFECTS, SEE particles.ParticleSystem)'''
+        particles.allocate(config["game"]["particle-capacity"])
 
 
     '''============== SETTINGS METHODS ================='''
 
-    def load_map(self, level_name: str) -> None:
+    def load_map(self, level_name: str, render_bg: bool = True) -> None:
         '''Load the map and the player. Must be called before the main loop.'''
 
-        '''LOAD ENTITIES'''
-        self.player = Joel(self.config,init_x=64,init_y=0)
-        #self.kittol = Kittol(self.config,init_x=580,init_y=230)
+        '''LOAD MAP (LEVELS WITH "streaming" SET ONLY KEEP THE CHUNKS AROUND THE PLAYER LOADED)'''
+        level_class = LevelLoader.level_class(self.config, level_name)
+        self._start_level(level_class(config=self.config,
+                                      level_name=level_name,
+                                      print_load_message=True,
+                                      render_bg=render_bg))
 
-        '''CREATE GROUP OF ENTITIES'''
-        self.group.append(self.player)
-        #self.group.append(self.kittol)
-        self.n_entities = len(self.group)
+    def load_map_async(self, level_name: str, render_bg: bool = True) -> None:
+        '''Starts loading a map in the background. The current map keeps running and the new
+        one (with a new player) replaces it at the start of the frame it is ready (see advance).'''
 
-        '''LOAD MAP'''
-        self.level = Level(config=self.config,
-                           level_name=level_name,
-                           print_load_message=True,
-                           render_bg=True)
+        if self.next_level is not None:
+            self.next_level.cancel()
+        self.next_level = self.loader.load(self.config, level_name, render_bg)
 
-        '''ADD ENTITIES TO THE LEVEL'''
-        for entity in self.group:
-            self.level.add_entity(entity=entity)
+    def _start_level(self, level) -> None:
+        '''Replaces the current map by a loaded one and creates its entities.'''
+
+        '''UNLOAD CURRENT MAP AND ENTITIES (THEIR SHARED ASSETS STAY CACHED FOR REUSE)'''
+        if self.level is not None:
+            for entity in self.group:
+                entity.release_textures()
+            self.level.unload()
+        self.level = level
+
+        '''PHYSICS BACKEND FOR NON-PLAYER ENTITIES ("scalar" OR "numpy")'''
+        self.group = []
+        self.batch_physics = None
+        if self.config["game"]["physics-backend"] == "numpy":
+            self.batch_physics = BatchPhysics()
+
+        '''ENTITY SCHEDULING (FAR ENTITIES ARE UPDATED LESS OFTEN AND RESTING ONES SLEEP, SEE
+        scheduler.EntityScheduler)'''
+        self.scheduler = None
+        if self.config["game"]["entity-scheduler"]:
+            self.scheduler = EntityScheduler(margin=self.config["game"]["near-margin"],
+                                             far_interval=self.config["game"]["far-update-interval"])
+
+        '''PARTICLES BOUNCE ON THE COLLISION LAYER (NOT ON STREAMING LEVELS, SEE collision_layer)'''
+        particles.clear()
+        if self.config["game"]["particle-collisions"]:
+            particles.set_tiles(level.collision_layer(), level.n_cols, level.n_rows, level.tile_size)
+        else:
+            particles.set_tiles(None, 0, 0, 0)
+
+        '''LOAD ENTITIES, CREATE GROUP OF ENTITIES AND ADD THEM TO THE LEVEL'''
+        self.player = Joel(self.config,init_x=64,init_y=0)
+        self.spawn(self.player)
+        #self.spawn(Kittol(self.config,init_x=580,init_y=230))
 
         '''INITIALIZE CAMERA (FOLLOW METHOD)'''
         self.target_player = self.player
         self.camera = Camera(self.display_resolution)
+        if self.renderer is not None:
+            self.renderer.invalidate()
+
+    def spawn(self, entity) -> None:
+        '''Adds an entity to the group, to the level and to the scheduler. Non-player entities
+        are integrated by the batch physics backend when it is enabled.'''
+
+        self.group.append(entity)
+        self.n_entities = len(self.group)
+        self.level.add_entity(entity=entity)
+        if self.scheduler is not None:
+            self.scheduler.add(entity)
+        if self.batch_physics is not None and entity is not self.player:
+            self.batch_physics.add(entity)
 
 
     '''============== GAME LOOP METHODS ================'''
@@ -76,35 +177,126 @@ class Game:
 
         '''CATCH GAME EVENTS'''
         for event in pygame.event.get():
+            latency.received(event)
 
             '''QUIT GAME EVENT'''
             if event.type == QUIT:
-                pygame.quit()
-                exit()
+                self.quit()
             if event.type == KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    exit()
+                    self.quit()
+
+                '''PROFILER CONTROL'''
+                if event.key == pygame.K_F3:
+                    profiler.toggle()
+                elif event.key == pygame.K_F4:
+                    profiler.export(self.profile_filename or 'profile.csv')
 
             '''PLAYER CONTROL'''
+            if self.recorder is not None:
+                self.recorder.record(self.step_count, event)
             self.player.control(event)
 
-    def update(self) -> None:
-        '''Calls update methods for every entity created and also level updates.'''
+        latency.applied()
+        profiler.mark('handle_events')
+
+    def quit(self) -> None:
+        '''Saves the input recording and the profiler trace (if any) and closes the game.'''
+
+        if self.recorder is not None:
+            self.recorder.save(self.step_count)
+        if self.profile_filename is not None and profiler.trace:
+            profiler.export(self.profile_filename)
+        if latency.enabled:
+            latency.export(self.latency_filename)
+        self.loader.shutdown()
+        pygame.quit()
+        exit()
+
+    def advance(self, frame_time: float) -> int:
+        '''Runs as many fixed simulation steps as fit in the real time elapsed (frame_time, in
+        seconds) plus what was left from previous frames, up to max-steps-per-frame. Leftover time
+        becomes the interpolation factor used to render. With "step" input polling, the events
+        are drained right before every step (so input arriving while the previous steps ran is
+        applied to the next one). Returns the number of steps run.'''
+
+        '''SWAP IN THE LEVEL LOADING IN THE BACKGROUND ONCE IT IS READY'''
+        if self.next_level is not None and self.next_level.step(self.load_slice):
+            self._start_level(self.next_level.level)
+            self.next_level = None
+
+        self.accumulator += frame_time
+        steps = 0
+        while self.accumulator >= self.step_time and steps < self.max_steps_per_frame:
+            if self.poll_input_per_step:
+                profiler.mark('update')
+                self.handle_events()
+            self.update()
+            self.accumulator -= self.step_time
+            steps += 1
+
+        '''TOO FAR BEHIND: DROP THE BACKLOG INSTEAD OF SPIRALING'''
+        if self.accumulator >= self.step_time:
+            self.accumulator = self.accumulator % self.step_time
+
+        self.alpha = self.accumulator / self.step_time
+        profiler.mark('update')
+        return steps
 
-        '''UPDATE ENITIES POSITION AND CHECK FOR COLLISIONS'''
-        ix = 0
+    def update(self) -> None:
+        '''Runs one fixed simulation step: calls update methods for every entity created
+        and also level updates.'''
+
+        '''APPLY THE TILE EDITS QUEUED SINCE THE LAST STEP (SEE Level.set_tile), WAKING UP THE
+        ENTITIES AROUND THEM AND REDRAWING THEIR SCREEN REGION WITH THE DIRTY RECTANGLES RENDERER'''
+        for rect in self.level.apply_edits():
+            if self.scheduler is not None:
+                self.scheduler.wake_rect(rect)
+            if self.renderer is not None:
+                self.renderer.invalidate(rect)
+
+        '''STREAM THE LEVEL AROUND THE PLAYER (ONE SCREEN CENTERED ON IT)'''
+        focus = pygame.Rect((0, 0), self.display_resolution)
+        focus.center = self.player.entity_hitbox.center
+        self.level.stream(focus, self.player.velocity)
+
+        '''UPDATE ENITIES POSITION AND CHECK FOR COLLISIONS WITH TILES
+        (ENTITIES OUTSIDE THE LOADED PART OF THE LEVEL ARE FROZEN)'''
+        if self.scheduler is not None:
+            view = pygame.Rect(self.camera.offset, self.display_resolution)
+        if self.batch_physics is None:
+            dts = (self.scheduler.schedule(self.group, view, self.dt, self.step_count, focus=self.player)
+                   if self.scheduler is not None else [self.dt] * len(self.group))
+            for entity, dt in zip(self.group, dts):
+                if dt and self.level.is_loaded(entity.entity_hitbox):
+                    entity.update(dt, self.level.collision_grid)
+        else:
+            self.player.update(self.dt, self.level.collision_grid)
+            entities = self.batch_physics.entities
+            dts = (self.scheduler.schedule(entities, view, self.dt, self.step_count)
+                   if self.scheduler is not None else [self.dt] * len(entities))
+            dts = [dt if dt and self.level.is_loaded(entity.entity_hitbox) else 0.0
+                   for entity, dt in zip(entities, dts)]
+            self.batch_physics.step(dts, self.level.collision_grid)
+
+        '''CHECK ATTACK COLLISIONS BETWEEN ENTITIES (SORT AND SWEEP BROADPHASE)'''
         for entity in self.group:
-            aux = []
-            for i in range(self.n_entities):
-                if i != ix:
-                    aux.append(self.group[i].entity_hitbox)
-            entity.update(self.dt, self.level.tiles_per_layer[-1], aux)
-            ix += 1
+            entity.is_colliding_entities = False
+        for i, j in sweep_and_prune([entity.atk_hitbox for entity in self.group],
+                                    [entity.entity_hitbox for entity in self.group]):
+            if i != j:
+                self.group[i].is_colliding_entities = True
+
+        '''ADVANCE EVERY ANIMATION CLOCK AT ONCE AND MOVE THE PARTICLES'''
+        animation_clocks.advance(self.step_time)
+        particles.update(self.dt)
 
         '''CAMERA SCROLL'''
         #self.camera.scroll(target=self.target_player)
 
+        self.step_count += 1
+        latency.simulated()
+
         '''CHECK PLAYER DEATH POSITION (PLACEHOLDER)'''
         if self.player.position.y > self.height + 300:
             #self.player.reset()
@@ -114,15 +306,32 @@ class Game:
         '''Control and call the rendering of every instance:
         player, enemies, and map.'''
 
+        '''DIRTY RECTANGLES RENDERER'''
+        if self.renderer is not None:
+            self.renderer.render(self.level, self.camera, self.group, alpha=self.alpha)
+            return
+
         '''START FILLING THE SCREEN WITH BLACK BACKGROUND'''
         self.screen.fill((0,0,0))
 
         '''RENDER MAP'''
         self.level.render(self.screen, self.camera)
+        profiler.mark('level_render')
 
         '''RENDER ENTITIES'''
         for entity in self.group:
-            entity.render(self.screen, self.camera)
+            entity.render(self.screen, self.camera, alpha=self.alpha)
+        particles.render(self.screen, self.camera)
+        if profiler.enabled:
+            profiler.count('blits', self.n_entities + particles.count)
+        profiler.mark('entity_render')
+
+        '''PROFILER OVERLAY'''
+        profiler.draw_overlay(self.screen)
+        profiler.mark('overlay')
+        latency.rendered()
 
         '''UPDATE FULL DISPLAY SURFACE TO THE SCREEN'''
-        pygame.display.flip()
\ No newline at end of file
+        pygame.display.flip()
+        latency.flipped()
+        profiler.mark('flip')
\ No newline at end of file
@@ -0,0 +1,95 @@
+import pygame
+import csv
+import time
+
+
+class LatencyTracker:
+
+    STAGES = ('queued', 'received', 'applied', 'simulated', 'rendered', 'flipped')
+    TRACKED_EVENT_TYPES = {pygame.KEYDOWN: 'KEYDOWN', pygame.KEYUP: 'KEYUP'}
+
+    def __init__(self) -> None:
+        '''Follows every KEYDOWN/KEYUP event through the game loop and timestamps when it was
+        queued, received (drained from the event queue), applied to the entity state (control),
+        simulated (first update step after it), rendered (first frame drawn after that step) and
+        flipped (display update returned). pygame events carry no arrival time, so queued is the
+        end of the previous drain: queued -> received is an upper bound of the time the event
+        waited in the queue (frame rate wait, rendering...). Every method returns right away
+        when disabled.'''
+
+        self.enabled = False
+        self.events = []        # completed events: [event type, key, stage times...]
+        self._received = []
+        self._applied = []
+        self._simulated = []
+        self._rendered = []
+        self._last_drain = None
+
+    def received(self, event: pygame.event.Event) -> None:
+        if self.enabled and event.type in LatencyTracker.TRACKED_EVENT_TYPES:
+            now = time.perf_counter()
+            queued = self._last_drain if self._last_drain is not None else now
+            self._received.append([LatencyTracker.TRACKED_EVENT_TYPES[event.type], event.key, queued, now])
+
+    def applied(self) -> None:
+        '''Also ends the drain of the event queue (the start of the queue wait of the next events).'''
+
+        self._advance(self._received, self._applied)
+        if self.enabled:
+            self._last_drain = time.perf_counter()
+
+    def simulated(self) -> None:
+        self._advance(self._applied, self._simulated)
+
+    def rendered(self) -> None:
+        self._advance(self._simulated, self._rendered)
+
+    def flipped(self) -> None:
+        self._advance(self._rendered, self.events)
+
+    def percentiles(self, first: str, last: str) -> tuple:
+        '''Returns the (p50, p95, p99, max) time in ms between two stages over every event.'''
+
+        i, j = 2 + LatencyTracker.STAGES.index(first), 2 + LatencyTracker.STAGES.index(last)
+        values = sorted((event[j] - event[i]) * 1000 for event in self.events)
+        if not values:
+            return 0, 0, 0, 0
+        last_index = len(values) - 1
+        return tuple(values[min(int(q * len(values)), last_index)] for q in (0.50, 0.95, 0.99)) + (values[-1],)
+
+    def report(self) -> str:
+        '''Returns the latency distribution of every stage and of the whole loop as a table.'''
+
+        lines = [f'{len(self.events)} input events{"":12} {"p50":>7} {"p95":>7} {"p99":>7} {"max":>7}']
+        pairs = list(zip(LatencyTracker.STAGES, LatencyTracker.STAGES[1:])) + [('received', 'flipped'), ('queued', 'flipped')]
+        for first, last in pairs:
+            lines.append(f'{first + " -> " + last:30} ' + ' '.join(f'{value:>5.2f}ms' for value in self.percentiles(first, last)))
+        lines.append('(queued is the end of the previous event drain, so the times from it are upper bounds)')
+        return '\n'.join(lines)
+
+    def export(self, filename: str) -> None:
+        '''Writes every event with its stage times (ms since the first event) as csv.'''
+
+        start = self.events[0][2] if self.events else 0.0
+        with open(filename, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(('event', 'key') + LatencyTracker.STAGES)
+            for event in self.events:
+                writer.writerow(event[:2] + [f'{(stage - start) * 1000:.3f}' for stage in event[2:]])
+        print(self.report())
+        print(f'latency trace ({len(self.events)} events) saved to {filename}')
+
+    def _advance(self, source: list, destination: list) -> None:
+        '''Stamps every event waiting in source with the current time and moves it on.'''
+
+        if not self.enabled or not source:
+            return
+        now = time.perf_counter()
+        for event in source:
+            event.append(now)
+        destination.extend(source)
+        source.clear()
+
+
+'''SHARED LATENCY TRACKER (THE GAME LOOP STAMPS THE INPUT EVENTS HERE)'''
+latency = LatencyTracker()
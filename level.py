@@ -3,7 +3,14 @@
 import pygame
 import csv
 import os
+import time
+from array import array
+from assets import assets
+from background import Background
 from texture import SpriteSheet
+from collision import SpatialGrid, Collider, merge_solid_cells
+import level_cache
+from profiler import profiler
 
 
 class Tile:
@@ -18,26 +25,35 @@ class Tile:
         self.rect.x = x_pos
         self.rect.y = y_pos
 
-    def render(self, surface: pygame.Surface) -> None:
-        '''Renders the tile in a given surface.'''
+    def render(self, surface: pygame.Surface, offset: tuple[int, int] = (0, 0)) -> None:
+        '''Renders the tile in a given surface. offset is the position of the surface
+        upper left vertice in relation to the level.'''
 
-        surface.blit(self._texture, (self.rect.x, self.rect.y))
+        surface.blit(self._texture, (self.rect.x - offset[0], self.rect.y - offset[1]))
 
 
 class Level:
 
+    chunk_size_in_tiles = 8
+    max_collider_tiles = 32   # colliders span at most this many tiles, so an edit splits few cells
+
     def __init__(self,
                  config: dict,
                  level_name: str,
                  print_load_message: bool = False,
-                 render_bg: bool = False) -> None:
+                 render_bg: bool = False,
+                 prepared: tuple = None,
+                 deferred: bool = False) -> None:
         '''Creates and map the tiles to the specified level given the spritesheet and the
         filename_map.csv containing the level tiles layout. This class handle multiple layers,
         however keep in my that it should render the foreground(where the code check
         collisions) lastly. You can do this by simply setting the foreground lastly in the
-        settings.json.'''
+        settings.json.
+        prepared is the result of Level.prepare (computed here if not given). If deferred, the
+        level is only built by running load_steps (see loader.LevelLoader).'''
 
         self.config = config
+        self.level_name = level_name
         self.level = config[level_name]
         self.scale = config['display']['scale']
         self.original_tile_size = config[level_name]['tile-size']
@@ -46,38 +62,186 @@ class Level:
         self.gravity = self.level['physics']['gravity']
         self.friction = self.level['physics']['friction']
 
+        self.print_load_message = print_load_message
+        self.render_bg = render_bg
+        self.ready = False
+        self.spritesheets = []
+        self.background = None
+        self.pending_edits = {}
+        self._start_time = time.perf_counter()
+        self._prepared = prepared if prepared is not None else self.prepare(config, level_name, render_bg)
+        if not deferred:
+            for _ in self.load_steps():
+                pass
+
+    @staticmethod
+    def prepare(config: dict, level_name: str, render_bg: bool = False) -> tuple:
+        '''Loads the compiled level from the cache, or compiles it (and caches it) on a miss,
+        and reads the background images if render_bg. Returns (compiled level, cache hit,
+        background images). Does not touch the display or the shared assets, so it can run on
+        a worker thread.'''
+
+        cache_dir = config['game']['level-cache']
+        compiled = None
+        if cache_dir:
+            key = level_cache.cache_key(config, level_name)
+            compiled = level_cache.load(cache_dir, level_name, key)
+        cache_hit = compiled is not None
+        if compiled is None:
+            compiled = Level._compile(config, level_name)
+            if cache_dir:
+                level_cache.save(cache_dir, level_name, key, compiled)
+        return compiled, cache_hit, Background.prepare(config, level_name) if render_bg else None
+
+    def load_steps(self):
+        '''Builds the level from the prepared data (display format conversion, tiles, colliders
+        and chunk rendering). It is a generator that yields between small units of work, so the
+        build can be spread over several frames.'''
+
+        compiled, self.cache_hit, backgrounds = self._prepared
+        self.n_cols, self.n_rows = compiled.n_cols, compiled.n_rows
+        self.grid_per_layer = compiled.grid_per_layer
+
         '''LOOP THROUGH LAYERS'''
         self.tiles_per_layer = []
-        for layer in self.level['layers']:
-
-            '''LOAD SPRITESHEET, SCALE SIZE, AND ADD TEXTURES TO A LIST'''
-            spritesheet = SpriteSheet(filename=layer['sp'],
-                                      tile_size=(self.original_tile_size,self.original_tile_size),
-                                      scale=self.scale,
-                                      dimension=(layer['sp_w'],layer['sp_h']) )
+        for layer, grid, atlas in zip(self.level['layers'], compiled.grid_per_layer, compiled.atlas_per_layer):
+
+            '''GET THE SHARED SPRITESHEET (SLICED FROM THE PRE-SCALED LAYER ATLAS IF NOT LOADED YET)'''
+            spritesheet = assets.spritesheet(filename=layer['sp'],
+                                             tile_size=(self.original_tile_size,self.original_tile_size),
+                                             scale=self.scale,
+                                             dimension=(layer['sp_w'],layer['sp_h']),
+                                             alpha=layer.get('alpha', False),
+                                             atlas=atlas)
+            self.spritesheets.append(spritesheet)
+            yield
 
             '''CONSTRUCT LEVEL BY MAPPING ALL TILES'''
-            level_blueprint = Level._read_csv(layer['mapping'])
-            tiles = self._construct_level(spritesheet, level_blueprint)
+            tiles = []
+            yield from self._construct_level(spritesheet, grid, tiles)
             self.tiles_per_layer.append(tiles)
 
-        '''CREATE LEVEL SURFACE TO RENDER TILES ON TOP OF THE BACKGROUND'''
-        self.level_surface = pygame.Surface(size=(self.level['size_in_tiles'][0]*self.tile_size,
-                                                  self.level['size_in_tiles'][1]*self.tile_size))
-        self.level_surface.set_colorkey((0,0,0))
-        self.bg = pygame.transform.scale(pygame.image.load(self.level['bg']).convert(),
-                                         (self.level["size_in_tiles"][0]*self.tile_size,
-                                          self.level["size_in_tiles"][1]*self.tile_size))
-        self._render_tiles_to_surface(render_bg=render_bg)
-
-        '''LOADED MESSAGE'''
-        if print_load_message:
-            print(f'{self.level["name"]} successfully loaded')
-
-    def render(self, screen, camera) -> None:
-        '''Renders level surface to the game screen.'''
-
-        screen.blit(self.level_surface, (0 - camera.offset.x, 0 - camera.offset.y))
+        '''MERGE THE SOLID TILES OF THE COLLISION LAYER (LAST ONE) INTO FEW COLLIDERS (AT MOST
+        max_collider_tiles LONG) AND INDEX THEM FOR FAST HITBOX QUERIES (AN EDIT ONLY MERGES THE
+        CELLS AROUND IT AGAIN, SEE apply_edits)'''
+        self.chunk_size = Level.chunk_size_in_tiles * self.tile_size
+        self.collision_grid = SpatialGrid(cell_size=self.tile_size,
+                                          colliders=merge_solid_cells(self.grid_per_layer[-1], self.n_cols,
+                                                                      self.n_rows, self.tile_size,
+                                                                      max_span=Level.max_collider_tiles))
+        yield
+
+        '''CREATE LEVEL CHUNK SURFACES (THE BACKGROUND IS RENDERED SEPARATELY, BEHIND THEM)'''
+        self.size_in_pixels = (self.level['size_in_tiles'][0]*self.tile_size,
+                               self.level['size_in_tiles'][1]*self.tile_size)
+        if self.render_bg:
+            self.background = Background(self.config, self.level_name, backgrounds)
+            yield
+        yield from self._render_tiles_to_chunks()
+        self._finish_loading()
+
+    def render(self, screen, camera, area: pygame.Rect = None) -> None:
+        '''Renders the level chunks that intersect the camera viewport to the game screen.
+        If an area (screen rect) is given, only the chunks that intersect it are blitted (the
+        caller clips the screen to it, see renderer.DirtyRectRenderer).'''
+
+        if self.background is not None:
+            self.background.render(screen, camera, area)
+
+        size = self.chunk_size
+        n_rows, n_cols = len(self.chunks), len(self.chunks[0])
+        first_col, last_col, first_row, last_row = self._visible_chunks(camera, area, n_cols, n_rows)
+
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                screen.blit(self.chunks[row][col], (col*size - camera.offset.x, row*size - camera.offset.y))
+        if profiler.enabled:
+            profiler.count('blits', max(last_row - first_row + 1, 0) * max(last_col - first_col + 1, 0))
+
+    def stream(self, focus: pygame.Rect, velocity) -> None:
+        '''Keeps the level data around the focus area loaded. The whole level is always loaded
+        here (see streaming.StreamingLevel).'''
+
+        pass
+
+    def is_loaded(self, rect: pygame.Rect) -> bool:
+        '''Returns whether the level data (colliders) around rect is loaded.'''
+
+        return True
+
+    def set_tile(self, layer: int, col: int, row: int, tile_id: int) -> None:
+        '''Queues a tile change (tile_id is a texture index of the layer spritesheet, -1 removes
+        the tile). Negative layers count from the last one (-1 is the collision layer). The
+        edits queued during a step are applied together by apply_edits, which Game.update calls
+        once per step.'''
+
+        n_layers = len(self.spritesheets)
+        if not -n_layers <= layer < n_layers:
+            raise IndexError(f'layer {layer} does not exist (the level has {n_layers} layers)')
+        layer %= n_layers
+        if not (0 <= col < self.n_cols and 0 <= row < self.n_rows):
+            raise IndexError(f'tile ({col}, {row}) is outside the level ({self.n_cols}x{self.n_rows} tiles)')
+        n_textures = len(self.spritesheets[layer].textures)
+        if not (tile_id == -1 or 0 <= tile_id < n_textures):
+            raise IndexError(f'tile id {tile_id} is not in the layer {layer} spritesheet ({n_textures} tiles)')
+        self.pending_edits[(layer, col, row)] = tile_id
+
+    def apply_edits(self) -> list:
+        '''Applies the queued tile edits in one pass: updates the tile grids and tiles, renders
+        again only the edited cells of the chunk surfaces and merges again the colliders around
+        the edited cells of the collision layer (see _merge_colliders_around). The cost depends
+        on the number of edits, not on the size of the level or of its platforms. Returns the
+        level rects of the edited cells.'''
+
+        if not self.pending_edits:
+            return []
+        edits, self.pending_edits = self.pending_edits, {}
+        size, chunk_tiles = self.tile_size, Level.chunk_size_in_tiles
+        collision_layer = len(self.grid_per_layer) - 1
+        cells, collision_cells = set(), set()
+
+        for (layer, col, row), tile_id in edits.items():
+            index = row*self.n_cols + col
+            self.grid_per_layer[layer][index] = tile_id
+            self.tiles_per_layer[layer][index] = (Tile(col * size, row * size, self.spritesheets[layer].textures[tile_id])
+                                                  if tile_id != -1 else None)
+            cells.add((col, row))
+            if layer == collision_layer:
+                collision_cells.add((col, row))
+
+        '''RENDER THE EDITED CELLS AND MERGE THE COLLIDERS AROUND THEM AGAIN'''
+        rects = []
+        for col, row in cells:
+            chunk_col, chunk_row = col // chunk_tiles, row // chunk_tiles
+            rect = pygame.Rect(col * size, row * size, size, size)
+            Level._render_cell(self.chunks[chunk_row][chunk_col], self.tiles_per_layer, row*self.n_cols + col,
+                               rect, (chunk_col * self.chunk_size, chunk_row * self.chunk_size))
+            rects.append(rect)
+        for col, row in collision_cells:
+            self._merge_colliders_around(col, row)
+        return rects
+
+    def collision_tile(self, col: int, row: int) -> int:
+        '''Returns the tile id of a cell of the collision layer (-1 if empty or outside the level).'''
+
+        if 0 <= col < self.n_cols and 0 <= row < self.n_rows:
+            return self.grid_per_layer[-1][row*self.n_cols + col]
+        return -1
+
+    def collision_layer(self):
+        '''Returns the packed tile grid of the collision layer (row major, -1 for empty cells).'''
+
+        return self.grid_per_layer[-1]
+
+    def unload(self) -> None:
+        '''Releases the shared assets of the level (call it when switching levels).'''
+
+        for spritesheet in self.spritesheets:
+            assets.release(spritesheet)
+        if self.background is not None:
+            self.background.release()
+        self.spritesheets = []
+        self.background = None
 
     def add_entity(self, entity) -> None:
         '''Applies physical properties to every entity added.
@@ -92,38 +256,135 @@ class Level:
         entity.weight = entity.mass * self.gravity
         entity.acceleration = pygame.math.Vector2(0, self.gravity)
 
-    def _render_tiles_to_surface(self, render_bg=True) -> None:
-        '''Renders each mapped tile to the level background.'''
-
-        '''RENDER BG TO THE SURFACE'''
-        if render_bg:
-            self.level_surface.blit(self.bg, (0, 0))
+    def _finish_loading(self) -> None:
+        self._prepared = None
+        self.ready = True
+        self.load_time = time.perf_counter() - self._start_time
 
-        '''RENDER TILES ON TOP OF IT'''
+        '''LOADED MESSAGE'''
+        if self.print_load_message:
+            print(f'{self.level["name"]} successfully loaded in {self.load_time*1000:.1f} ms '
+                  f'({"cache hit" if self.cache_hit else "compiled"})')
+
+    def _render_tiles_to_chunks(self):
+        '''Splits the level in square chunk surfaces and renders each mapped tile to the
+        chunk that contains it (yields every few hundred tiles, see load_steps).'''
+
+        '''CREATE CHUNK SURFACES (EDGE CHUNKS ARE CROPPED TO THE LEVEL SIZE)'''
+        size = self.chunk_size
+        width, height = self.size_in_pixels
+        self.chunks = []
+        for y in range(0, height, size):
+            row = []
+            for x in range(0, width, size):
+                chunk = pygame.Surface(size=(min(size, width - x), min(size, height - y)))
+                chunk.set_colorkey((0,0,0))
+                row.append(chunk)
+                yield
+            self.chunks.append(row)
+
+        '''RENDER TILES'''
         for tile_layer in self.tiles_per_layer:
-            for tile in tile_layer:
-                tile.render(self.level_surface)
+            for i, tile in enumerate(tile_layer):
+                if tile is None:
+                    continue
+                chunk = self.chunks[tile.rect.y // size][tile.rect.x // size]
+                tile.render(chunk, offset=((tile.rect.x // size) * size, (tile.rect.y // size) * size))
+                if i % 512 == 511:
+                    yield
+
+    def _merge_colliders_around(self, col: int, row: int) -> None:
+        '''Merges again the solid cells of the collision layer in the window of the edited cell
+        and its neighbours (so a new tile joins the solid cells next to it). The colliders that
+        overlap the window are split: their parts outside it are kept as colliders of their own.
+        Colliders span at most max_collider_tiles, so the cost of an edit is bounded.'''
+
+        size = self.tile_size
+        window = pygame.Rect((col - 1) * size, (row - 1) * size, 3 * size, 3 * size).clip(
+            pygame.Rect(0, 0, self.n_cols * size, self.n_rows * size))
+
+        '''SPLIT THE COLLIDERS OVERLAPPING THE WINDOW (KEEP THE BANDS ABOVE AND BELOW IT AND THE
+        PARTS LEFT AND RIGHT OF IT)'''
+        for collider in [collider for collider in self.collision_grid.query(window) if collider.rect.colliderect(window)]:
+            self.collision_grid.remove(collider)
+            rect, inner = collider.rect, collider.rect.clip(window)
+            for part in ((rect.left, rect.top, rect.width, inner.top - rect.top),
+                         (rect.left, inner.bottom, rect.width, rect.bottom - inner.bottom),
+                         (rect.left, inner.top, inner.left - rect.left, inner.height),
+                         (inner.right, inner.top, rect.right - inner.right, inner.height)):
+                if part[2] > 0 and part[3] > 0:
+                    self.collision_grid.insert(Collider(pygame.Rect(part)))
+
+        for collider in merge_solid_cells(self.grid_per_layer[-1], self.n_cols, self.n_rows, size,
+                                          (window.x // size, window.y // size, window.w // size, window.h // size)):
+            self.collision_grid.insert(collider)
+
+    @staticmethod
+    def _render_cell(surface: pygame.Surface, tiles_per_layer: list, index: int, cell: pygame.Rect,
+                     offset: tuple[int, int]) -> None:
+        '''Renders one cell of a chunk surface again: clears it to the color key (so the
+        background shows through) and blits the tile of every layer in it, in order. offset is
+        the position of the chunk in the level.'''
+
+        surface.fill((0,0,0), cell.move(-offset[0], -offset[1]))
+        for tiles in tiles_per_layer:
+            tile = tiles[index]
+            if tile is not None:
+                tile.render(surface, offset=offset)
+
+    def _visible_chunks(self, camera, area: pygame.Rect, n_cols: int, n_rows: int) -> tuple:
+        '''Returns the (first_col, last_col, first_row, last_row) chunks that intersect the
+        screen area (the whole viewport if area is None).'''
+
+        size = self.chunk_size
+        if area is None:
+            area = pygame.Rect(0, 0, camera.display_width, camera.display_height)
+        left, top = int(camera.offset.x) + area.left, int(camera.offset.y) + area.top
+        return (max(left // size, 0), min((left + area.width - 1) // size, n_cols - 1),
+                max(top // size, 0), min((top + area.height - 1) // size, n_rows - 1))
+
+    @staticmethod
+    def _compile(config: dict, level_name: str) -> level_cache.CompiledLevel:
+        '''Compiles the level: parses every layer csv into a packed tile grid and loads,
+        slices and scales every layer spritesheet into a tile atlas.'''
+
+        level = config[level_name]
+        tile_size = level['tile-size']
+        grid_per_layer, atlas_per_layer = [], []
+        for layer in level['layers']:
+
+            '''LOAD SPRITESHEET, SCALE SIZE, AND PACK TEXTURES IN AN ATLAS'''
+            atlas_per_layer.append(SpriteSheet.scale_atlas(filename=layer['sp'],
+                                                           tile_size=(tile_size,tile_size),
+                                                           scale=config['display']['scale'],
+                                                           dimension=(layer['sp_w'],layer['sp_h']),
+                                                           alpha=layer.get('alpha', False)))
+
+            '''PACK LEVEL BLUEPRINT'''
+            level_blueprint = Level._read_csv(layer['mapping'])
+            n_rows, n_cols = len(level_blueprint), len(level_blueprint[0])
+            grid_per_layer.append(array('h', [int(cell) for row in level_blueprint for cell in row]))
+
+        return level_cache.CompiledLevel(n_cols, n_rows, grid_per_layer, atlas_per_layer)
 
     def _construct_level(self,
                          spritesheet: object,
-                         level_blueprint: list) -> list:
-        '''Constructs level by creating and mapping all tiles.'''
+                         grid: array,
+                         tiles: list):
+        '''Constructs level by creating and mapping all tiles of a packed tile grid into
+        tiles, one entry per cell in the grid order (None for empty cells, so a cell tile is
+        found by its index, see apply_edits). Yields after every row, see load_steps.'''
 
         '''TILES SWEEP LEVEL CONSTRUCTION'''
-        n_rows = len(level_blueprint)
-        n_cols = len(level_blueprint[0])
-        x, y = 0, 0
-        tiles = []
-        for i in range(n_rows):
-            x = 0
-            for j in range(n_cols):
-                if level_blueprint[i][j] != '-1':
-                    tiles.append(Tile(x * self.tile_size, y * self.tile_size,
-                                        spritesheet.textures[int(level_blueprint[i][j])]))
-                x += 1
-            y += 1
-
-        return tiles
+        for i in range(self.n_rows):
+            for j in range(self.n_cols):
+                tile_id = grid[i*self.n_cols + j]
+                if tile_id != -1:
+                    tiles.append(Tile(j * self.tile_size, i * self.tile_size,
+                                      spritesheet.textures[tile_id]))
+                else:
+                    tiles.append(None)
+            yield
 
     @staticmethod
     def _read_csv(filename_map: str) -> list:
@@ -136,4 +397,4 @@ class Level:
             for row in data:
                 level_blueprint.append(list(row))
 
-        return level_blueprint
\ No newline at end of file
+        return level_blueprint
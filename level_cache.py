@@ -0,0 +1,141 @@
+import pygame
+import hashlib
+import json
+import struct
+import os
+from array import array
+
+
+CACHE_VERSION = 2
+_MAGIC = b'JTSL'
+
+
+class CompiledLevel:
+
+    def __init__(self, n_cols: int, n_rows: int, grid_per_layer: list, atlas_per_layer: list) -> None:
+        '''Holds the compiled data of a level: one packed tile grid (array of signed shorts,
+        row major, -1 for empty cells) and one pre-scaled tile atlas surface per layer.'''
+
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        self.grid_per_layer = grid_per_layer
+        self.atlas_per_layer = atlas_per_layer
+
+
+def cache_key(config: dict, level_name: str) -> str:
+    '''Hashes everything the compiled level depends on: the level and display settings
+    plus the content of every asset file the level reads.'''
+
+    level = config[level_name]
+    digest = hashlib.sha1()
+    digest.update(str(CACHE_VERSION).encode())
+    digest.update(json.dumps([level, config['display']], sort_keys=True).encode())
+    for layer in level['layers']:
+        for filename in (layer['mapping'], layer['sp']):
+            with open(filename, 'rb') as data:
+                digest.update(data.read())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir: str, level_name: str, key: str) -> str:
+    '''Returns the path of the cache file of a level.'''
+
+    return os.path.join(cache_dir, f'{level_name}-{key}.bin')
+
+
+def load(cache_dir: str, level_name: str, key: str) -> CompiledLevel:
+    '''Reads a compiled level from the cache. Returns None on a cache miss, and also when the
+    cache file is truncated or corrupt (the caller compiles the level and saves it again).
+    The atlas surfaces are not converted to the display format (caller's job).'''
+
+    path = cache_path(cache_dir, level_name, key)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as data:
+        blob = data.read()
+    if blob[:4] != _MAGIC:
+        return None
+
+    try:
+        '''HEADER: MAGIC | HEADER SIZE | JSON HEADER'''
+        header_size, = struct.unpack_from('<I', blob, 4)
+        offset = 8 + header_size
+        header = json.loads(blob[8:offset])
+
+        '''THE BLOB MUST HOLD EXACTLY THE GRIDS AND ATLASES THE HEADER DESCRIBES'''
+        grid_size = header['n_cols'] * header['n_rows'] * 2
+        atlas_bytes = [width * height * len(atlas_format)
+                       for (width, height), atlas_format in zip(header['atlas_sizes'], header['atlas_formats'])]
+        if len(blob) != offset + len(atlas_bytes) * grid_size + sum(atlas_bytes):
+            return None
+
+        grid_per_layer, atlas_per_layer = [], []
+        for atlas_size, atlas_format, size in zip(header['atlas_sizes'], header['atlas_formats'], atlas_bytes):
+            grid = array('h')
+            grid.frombytes(blob[offset:offset + grid_size])
+            offset += grid_size
+            atlas = pygame.image.frombuffer(blob[offset:offset + size], atlas_size, atlas_format)
+            offset += size
+            grid_per_layer.append(grid)
+            atlas_per_layer.append(atlas)
+    except (ValueError, KeyError, struct.error, pygame.error):
+        return None
+
+    return CompiledLevel(header['n_cols'], header['n_rows'], grid_per_layer, atlas_per_layer)
+
+
+def save(cache_dir: str, level_name: str, key: str, compiled: CompiledLevel) -> None:
+    '''Writes a compiled level to the cache, removing older cache files of the same level.'''
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for filename in os.listdir(cache_dir):
+        if filename.startswith(f'{level_name}-') and filename.endswith('.bin'):
+            os.remove(os.path.join(cache_dir, filename))
+
+    header = json.dumps({'n_cols': compiled.n_cols,
+                         'n_rows': compiled.n_rows,
+                         'atlas_sizes': [atlas.get_size() for atlas in compiled.atlas_per_layer],
+                         'atlas_formats': [_pixel_format(atlas) for atlas in compiled.atlas_per_layer]}).encode()
+
+    '''WRITE TO A TEMPORARY FILE FIRST SO A CRASH NEVER LEAVES A HALF WRITTEN CACHE'''
+    path = cache_path(cache_dir, level_name, key)
+    with open(path + '.tmp', 'wb') as data:
+        data.write(_MAGIC)
+        data.write(struct.pack('<I', len(header)))
+        data.write(header)
+        for grid, atlas in zip(compiled.grid_per_layer, compiled.atlas_per_layer):
+            data.write(grid.tobytes())
+            data.write(pygame.image.tostring(atlas, _pixel_format(atlas)))
+    os.replace(path + '.tmp', path)
+
+
+def _pixel_format(atlas: pygame.Surface) -> str:
+    '''Atlases with per pixel alpha are stored as RGBA, the others as RGB.'''
+
+    return 'RGBA' if atlas.get_flags() & pygame.SRCALPHA else 'RGB'
+
+
+def compile_levels(config: dict, level_names: list) -> None:
+    '''Compiles the given levels into the cache (cold load), then loads them again from it
+    (warm load) and prints both load times.'''
+
+    from level import Level
+    for level_name in level_names:
+        path = cache_path(config['game']['level-cache'], level_name, cache_key(config, level_name))
+        if os.path.exists(path):
+            os.remove(path)
+        cold = Level(config=config, level_name=level_name, render_bg=True).load_time
+        warm = Level(config=config, level_name=level_name, render_bg=True).load_time
+        print(f'{level_name}: cold load {cold*1000:.1f} ms, warm load {warm*1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    '''COMPILE EVERY LEVEL IN THE SETTINGS (OR THE ONES GIVEN AS ARGUMENTS)'''
+    import sys
+    with open("settings.json") as json_file:
+        game_config = json.load(json_file)
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    names = sys.argv[1:] or [name for name, section in game_config.items() if 'layers' in section]
+    compile_levels(game_config, names)
@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from level import Level
+from streaming import StreamingLevel
+
+
+class LevelHandle:
+
+    def __init__(self, future, level_class: type, config: dict, level_name: str, render_bg: bool) -> None:
+        '''Handle of a level being loaded by a LevelLoader. The file reading and parsing runs
+        on a worker thread (the future); the display bound part (texture conversion, tiles and
+        chunk rendering) is run by step on the main thread, a few milliseconds per frame.'''
+
+        self.level_name = level_name
+        self.level = None
+        self._future = future
+        self._level_class = level_class
+        self._config = config
+        self._render_bg = render_bg
+        self._steps = None
+        self._start_time = time.perf_counter()
+
+    def step(self, budget: float) -> bool:
+        '''Runs build steps for up to budget seconds once the worker is done. Returns whether
+        the level is ready.'''
+
+        if self.level is not None and self.level.ready:
+            return True
+        if not self._future.done():
+            return False
+
+        deadline = time.perf_counter() + budget
+        if self._steps is None:
+            self.level = self._level_class(config=self._config,
+                                           level_name=self.level_name,
+                                           render_bg=self._render_bg,
+                                           prepared=self._future.result(),
+                                           deferred=True)
+            self._steps = self.level.load_steps()
+        for _ in self._steps:
+            if time.perf_counter() >= deadline:
+                return False
+        self.load_time = time.perf_counter() - self._start_time
+        return True
+
+    def result(self) -> Level:
+        '''Waits for the worker and finishes the build right away. Returns the level.'''
+
+        self._future.result()
+        while not self.step(budget=float('inf')):
+            pass
+        return self.level
+
+    def cancel(self) -> None:
+        '''Drops the level (its shared assets are released if the build had started).'''
+
+        self._future.cancel()
+        if self.level is not None:
+            self.level.unload()
+        self.level = None
+
+
+class LevelLoader:
+
+    def __init__(self, max_workers: int = 1) -> None:
+        '''Loads levels in the background while the current level keeps running (see
+        Game.load_map_async).'''
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='level-loader')
+
+    def load(self, config: dict, level_name: str, render_bg: bool = True) -> LevelHandle:
+        '''Starts loading a level. Returns its handle.'''
+
+        level_class = LevelLoader.level_class(config, level_name)
+        future = self._executor.submit(level_class.prepare, config, level_name, render_bg)
+        return LevelHandle(future, level_class, config, level_name, render_bg)
+
+    @staticmethod
+    def level_class(config: dict, level_name: str) -> type:
+        '''Levels with "streaming" set only keep the chunks around the player loaded.'''
+
+        return StreamingLevel if config[level_name].get("streaming") else Level
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
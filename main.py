@@ -1,31 +1,62 @@
-
-
-
 from game import Game
+from replay import InputRecorder, replay
+from profiler import profiler
+from latency import latency
+import argparse
 import json
 
 
 def main() -> None:
     '''This is the main function.'''
 
+    '''COMMAND LINE OPTIONS'''
+    parser = argparse.ArgumentParser(description='Joel the Squid')
+    parser.add_argument('--level', default='title-screen', help='level to load')
+    parser.add_argument('--record', metavar='FILE', help='record player input to FILE')
+    parser.add_argument('--replay', metavar='FILE', help='replay a recording headless and exit')
+    parser.add_argument('--trace', metavar='FILE', help='write a position/velocity trace of the replay')
+    parser.add_argument('--profile', metavar='FILE', help='start with the frame profiler on, save its trace '
+                                                          '(.csv or .json) to FILE')
+    parser.add_argument('--latency', metavar='FILE', help='track the input to display latency of every key event, '
+                                                          'save it as csv to FILE and print its distribution on quit')
+    parser.add_argument('--input-polling', choices=('frame', 'step'),
+                        help='drain input once per frame or before every simulation step (overrides settings.json)')
+    args = parser.parse_args()
+
     '''OPEN CONFIGURATION'''
     with open("settings.json") as json_file:
         game_config = json.load(json_file)
+    if args.input_polling:
+        game_config["game"]["input-polling"] = args.input_polling
+
+    '''HEADLESS REPLAY'''
+    if args.replay:
+        replay(config=game_config, recording_filename=args.replay, trace_filename=args.trace)
+        return
 
     '''INITIALIZE GAME INSTANCE'''
     game = Game(config=game_config)
 
     '''INITIALIZE LEVEL'''
-    game.load_map(level_name='title-screen')
-    #game.load_map(level_name='level-test')
+    game.load_map(level_name=args.level)
+    if args.record:
+        game.recorder = InputRecorder(args.record, args.level)
+    if args.profile:
+        game.profile_filename = args.profile
+        profiler.toggle()
+    if args.latency:
+        game.latency_filename = args.latency
+        latency.enabled = True
 
     while True:
-        game.clock.tick(game.fps)
-        game.handle_events()
-        game.update()
+        frame_time = game.clock.tick(game.render_fps) * 0.001
+        profiler.begin_frame()
+        if not game.poll_input_per_step:
+            game.handle_events()
+        game.advance(frame_time)
         game.render()
+        profiler.end_frame()
 
 
 if __name__ == '__main__':
     main()
-
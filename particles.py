@@ -0,0 +1,247 @@
+import pygame
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, particles are disabled without it
+    np = None
+
+
+class Emitter:
+
+    def __init__(self,
+                 count: int,
+                 speed: tuple[float, float],
+                 angle: float,
+                 spread: float,
+                 life: tuple[float, float],
+                 gravity: float,
+                 sprites: list) -> None:
+        '''Burst of particles spawned by one event. speed (pixels per step) and life (steps)
+        are (min, max) ranges, angle is the direction in degrees (0 is forward, 90 is up) and
+        particles are spread over angle +- spread/2. sprites is a list of (color, size in
+        pixels) squares, one is picked at random for every particle.'''
+
+        self.count = count
+        self.speed = speed
+        self.angle = angle
+        self.spread = spread
+        self.life = life
+        self.gravity = gravity
+        self.sprites = sprites
+        self.first_sprite = 0   # index of its first sprite in the particle system
+
+
+'''EFFECTS OF THE ENTITY EVENTS (SEE Entity.attack, dash, jump AND THE LANDING IN _handle_collisions_y)'''
+DEFAULT_EMITTERS = {
+    'attack': Emitter(count=24, speed=(4.0, 10.0), angle=0.0, spread=50.0, life=(10, 22), gravity=0.15,
+                      sprites=[((255, 255, 255), 6), ((170, 230, 255), 6), ((120, 200, 255), 3)]),
+    'dash': Emitter(count=20, speed=(2.0, 6.0), angle=-90.0, spread=70.0, life=(10, 20), gravity=0.05,
+                    sprites=[((255, 240, 170), 6), ((255, 200, 90), 3)]),
+    'jump': Emitter(count=10, speed=(1.0, 3.0), angle=90.0, spread=160.0, life=(8, 16), gravity=0.1,
+                    sprites=[((200, 190, 170), 6), ((160, 150, 135), 3)]),
+    'landing': Emitter(count=16, speed=(1.5, 4.0), angle=90.0, spread=170.0, life=(10, 20), gravity=0.2,
+                       sprites=[((200, 190, 170), 6), ((160, 150, 135), 3)]),
+}
+
+
+class ParticleSystem:
+
+    def __init__(self, capacity: int = 0, emitters: dict = None) -> None:
+        '''Fixed capacity pool of particles kept in preallocated numpy arrays (position,
+        velocity, gravity, lifetime and sprite index, live particles packed at the front).
+        update moves all of them in one vectorized pass (with an optional bounce against the
+        level tiles) and render draws them with a single Surface.blits call. The update and
+        the compaction of dead particles work in place on scratch buffers, so nothing is
+        allocated per frame. Bursts that do not fit in the pool are cut short.'''
+
+        self.emitters = {}
+        self.sprites = []
+        self.count = 0
+        self.drag = 0.96
+        self.bounce = 0.4
+        self._rng = np.random.default_rng(0) if np is not None else None
+        self._tiles = None
+        for name, emitter in (emitters if emitters is not None else DEFAULT_EMITTERS).items():
+            self.add_emitter(name, emitter)
+        self.allocate(capacity)
+
+    def allocate(self, capacity: int) -> None:
+        '''(Re)allocates the pool, dropping every live particle.'''
+
+        self.capacity = capacity if np is not None else 0
+        self.count = 0
+        if np is None:
+            return
+        self.px, self.py, self.vx, self.vy, self.gravity, self.life = (np.zeros(self.capacity) for _ in range(6))
+        self.sprite = np.zeros(self.capacity, dtype=np.int32)
+
+        '''SCRATCH BUFFERS'''
+        self._float = np.zeros(self.capacity)
+        self._float2 = np.zeros(self.capacity)
+        self._int = np.zeros(self.capacity, dtype=np.int32)
+        self._int2 = np.zeros(self.capacity, dtype=np.int32)
+        self._cell = np.zeros(self.capacity, dtype=np.int16)
+        self._mask = np.zeros(self.capacity, dtype=bool)
+        self._mask2 = np.zeros(self.capacity, dtype=bool)
+
+    def add_emitter(self, name: str, emitter: Emitter) -> None:
+        emitter.first_sprite = len(self.sprites)
+        for color, size in emitter.sprites:
+            sprite = pygame.Surface((size, size))
+            sprite.fill(color)
+            self.sprites.append(sprite)
+        self.emitters[name] = emitter
+
+    def set_tiles(self, grid, n_cols: int, n_rows: int, tile_size: int) -> None:
+        '''Makes the particles bounce on the solid cells of a packed tile grid (row major, -1
+        for empty cells, e.g. Level.collision_layer). The grid is used in place, so later
+        edits of the level are seen. None turns the collisions off.'''
+
+        if grid is None or np is None:
+            self._tiles = None
+            return
+        self._tiles = (np.frombuffer(grid, dtype=np.int16), n_cols, n_rows, tile_size)
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def emit(self, name: str, x: float, y: float, facing_left: bool = False) -> None:
+        '''Spawns a burst of the named emitter at (x, y). facing_left mirrors its direction.'''
+
+        emitter = self.emitters[name]
+        first = self.count
+        k = min(emitter.count, self.capacity - first)
+        if k <= 0:
+            return
+        last = first + k
+        rng, tmp, tmp2 = self._rng, self._float[:k], self._float2[:k]
+
+        '''DIRECTION (RANDOM ANGLE IN THE SPREAD) AND SPEED'''
+        rng.random(out=tmp)
+        tmp -= 0.5
+        tmp *= math.radians(emitter.spread)
+        tmp += math.radians(emitter.angle)
+        rng.random(out=tmp2)
+        tmp2 *= emitter.speed[1] - emitter.speed[0]
+        tmp2 += emitter.speed[0]
+        vx, vy = self.vx[first:last], self.vy[first:last]
+        np.cos(tmp, out=vx)
+        vx *= tmp2
+        if facing_left:
+            np.negative(vx, out=vx)
+        np.sin(tmp, out=vy)
+        vy *= tmp2
+        np.negative(vy, out=vy)   # screen y points down
+
+        '''POSITION, GRAVITY, LIFETIME AND SPRITE'''
+        self.px[first:last] = x
+        self.py[first:last] = y
+        self.gravity[first:last] = emitter.gravity
+        rng.random(out=tmp)
+        tmp *= emitter.life[1] - emitter.life[0]
+        tmp += emitter.life[0]
+        self.life[first:last] = tmp
+        rng.random(out=tmp)
+        tmp *= len(emitter.sprites)
+        np.copyto(self.sprite[first:last], tmp, casting='unsafe')
+        self.sprite[first:last] += emitter.first_sprite
+        self.count = last
+
+    def update(self, dt: float) -> None:
+        '''Moves every particle for a given dt (in simulation steps), bounces them on the solid
+        tiles and drops the dead ones.'''
+
+        n = self.count
+        if n == 0:
+            return
+        px, py, vx, vy, life = self.px[:n], self.py[:n], self.vx[:n], self.vy[:n], self.life[:n]
+        tmp = self._float[:n]
+
+        '''GRAVITY, DRAG AND POSITION'''
+        np.multiply(self.gravity[:n], dt, out=tmp)
+        vy += tmp
+        drag = self.drag ** dt
+        vx *= drag
+        vy *= drag
+        np.multiply(vx, dt, out=tmp)
+        px += tmp
+        np.multiply(vy, dt, out=tmp)
+        py += tmp
+        life -= dt
+
+        '''TILE COLLISIONS (PARTICLES THAT ENDED IN A SOLID CELL GO BACK AND BOUNCE)'''
+        if self._tiles is not None:
+            hit = self._solid(px, py, n)
+            np.multiply(vx, dt, out=tmp)
+            np.subtract(px, tmp, out=px, where=hit)
+            np.multiply(vy, dt, out=tmp)
+            np.subtract(py, tmp, out=py, where=hit)
+            np.multiply(vy, -self.bounce, out=vy, where=hit)
+            np.multiply(vx, self.bounce, out=vx, where=hit)
+
+        '''COMPACT THE LIVE PARTICLES AT THE FRONT OF THE POOL'''
+        alive = self._mask[:n]
+        np.greater(life, 0, out=alive)
+        m = int(np.count_nonzero(alive))
+        if m < n:
+            for buffer, scratch in ((self.px, self._float), (self.py, self._float), (self.vx, self._float),
+                                    (self.vy, self._float), (self.gravity, self._float), (self.life, self._float),
+                                    (self.sprite, self._int)):
+                np.compress(alive, buffer[:n], out=scratch[:m])
+                buffer[:m] = scratch[:m]
+            self.count = m
+
+    def render(self, screen: pygame.Surface, camera) -> pygame.Rect:
+        '''Draws every live particle with one blits call. Returns the screen area drawn on (for
+        the dirty rectangles renderer), or None if there are no particles.'''
+
+        n = self.count
+        if n == 0:
+            return None
+        xs, ys = self._int[:n], self._int2[:n]
+        np.subtract(self.px[:n], camera.offset.x, out=xs, casting='unsafe')
+        np.subtract(self.py[:n], camera.offset.y, out=ys, casting='unsafe')
+        sprites = self.sprites
+        screen.blits(zip(map(sprites.__getitem__, self.sprite[:n].tolist()), zip(xs.tolist(), ys.tolist())),
+                     doreturn=False)
+
+        '''BOUNDING BOX (THE BIGGEST SPRITE SIZE IS ADDED TO THE RIGHT AND BOTTOM)'''
+        size = max(sprite.get_width() for sprite in sprites)
+        left, top = int(xs.min()), int(ys.min())
+        return pygame.Rect(left, top, int(xs.max()) - left + size, int(ys.max()) - top + size).clip(screen.get_rect())
+
+    def _solid(self, px, py, n: int):
+        '''Returns the mask (a scratch buffer) of the particles inside a solid cell.'''
+
+        grid, n_cols, n_rows, tile_size = self._tiles
+        cols, rows, tmp = self._int[:n], self._int2[:n], self._float[:n]
+        inside, hit = self._mask[:n], self._mask2[:n]
+
+        np.floor_divide(px, tile_size, out=tmp)
+        np.copyto(cols, tmp, casting='unsafe')
+        np.floor_divide(py, tile_size, out=tmp)
+        np.copyto(rows, tmp, casting='unsafe')
+
+        '''ONLY CELLS INSIDE THE LEVEL CAN BE SOLID'''
+        np.greater_equal(cols, 0, out=inside)
+        np.less(cols, n_cols, out=hit)
+        inside &= hit
+        np.greater_equal(rows, 0, out=hit)
+        inside &= hit
+        np.less(rows, n_rows, out=hit)
+        inside &= hit
+
+        np.clip(cols, 0, n_cols - 1, out=cols)
+        np.clip(rows, 0, n_rows - 1, out=rows)
+        rows *= n_cols
+        rows += cols
+        cells = self._cell[:n]
+        np.take(grid, rows, out=cells)
+        np.not_equal(cells, -1, out=hit)
+        hit &= inside
+        return hit
+
+
+'''SHARED PARTICLE SYSTEM (ALLOCATED BY THE GAME, SEE "particle-capacity" IN settings.json)'''
+particles = ParticleSystem()
@@ -0,0 +1,192 @@
+import pygame
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed by the "numpy" physics backend
+    np = None
+
+
+class RowVector:
+
+    __slots__ = ('_xs', '_ys', '_row')
+
+    def __init__(self, xs, ys, row: int) -> None:
+        '''Vector2-like view over one row of a pair of numpy arrays. Entities in a BatchPhysics
+        keep their position, velocity and acceleration as row views, so the scalar entity code
+        (control, jump, collisions...) reads and writes the batch buffers directly.'''
+
+        self._xs = xs
+        self._ys = ys
+        self._row = row
+
+    @property
+    def x(self) -> float:
+        return self._xs[self._row]
+
+    @x.setter
+    def x(self, value: float) -> None:
+        self._xs[self._row] = value
+
+    @property
+    def y(self) -> float:
+        return self._ys[self._row]
+
+    @y.setter
+    def y(self, value: float) -> None:
+        self._ys[self._row] = value
+
+    def __iter__(self):
+        yield self._xs[self._row]
+        yield self._ys[self._row]
+
+    def __repr__(self) -> str:
+        return f'RowVector({self.x}, {self.y})'
+
+
+class BatchPhysics:
+
+    STATS = ('walk_accel', 'run_boost', 'max_x_velocity', 'max_y_velocity',
+             'slipperiness', 'traction', 'weight', 'friction')
+
+    def __init__(self, capacity: int = 64) -> None:
+        '''Struct of arrays physics backend. Stores position, velocity, acceleration and the
+        movement stats of many entities in numpy buffers and integrates all of them in one
+        vectorized step, reproducing Entity._horizontal_movement, _limit_horizontal_velocity and
+        _vertical_movement. Tile collisions are still resolved per entity.'''
+
+        if np is None:
+            raise ImportError('the numpy physics backend needs numpy installed')
+
+        self.entities = []
+        self._allocate(capacity)
+
+    def add(self, entity) -> None:
+        '''Moves an entity (already added to the level) into the batch and turns its position,
+        velocity and acceleration into views over its rows.'''
+
+        row = len(self.entities)
+        if row == self._capacity:
+            self._allocate(self._capacity * 2)
+        self.entities.append(entity)
+
+        self.px[row], self.py[row] = entity.position.x, entity.position.y
+        self.vx[row], self.vy[row] = entity.velocity.x, entity.velocity.y
+        self.ax[row], self.ay[row] = entity.acceleration.x, entity.acceleration.y
+        self._bind(row)
+        self.sync_stats(row)
+
+    def remove(self, entity) -> None:
+        '''Takes an entity out of the batch, giving it back plain pygame vectors. The last row
+        is moved into the freed one.'''
+
+        row = self.entities.index(entity)
+        entity.position = pygame.math.Vector2(tuple(entity.position))
+        entity.velocity = pygame.math.Vector2(tuple(entity.velocity))
+        entity.acceleration = pygame.math.Vector2(tuple(entity.acceleration))
+
+        last = len(self.entities) - 1
+        for buffer in self._buffers():
+            buffer[row] = buffer[last]
+        self.entities[row] = self.entities[last]
+        self.entities.pop()
+        if row != last:
+            self._bind(row)
+
+    def sync_stats(self, row: int = None) -> None:
+        '''Copies the movement stats of one entity (or every entity) into the batch. Call it
+        after changing an entity stat such as mass, walk_accel or max_x_velocity.'''
+
+        rows = range(len(self.entities)) if row is None else (row,)
+        for i in rows:
+            entity = self.entities[i]
+            for stat in BatchPhysics.STATS:
+                self.stats[stat][i] = getattr(entity, stat)
+
+    def step(self, dt: float, tiles) -> None:
+        '''Integrates every entity of the batch for a given dt and resolves their tile
+        collisions (same order as Entity.update: x movement, x collisions, y movement,
+        y collisions). dt can also be a list with the dt of every entity of the batch, in
+        order; entities with a dt of 0 are left untouched (see scheduler.EntityScheduler).'''
+
+        n = len(self.entities)
+        if n == 0:
+            return
+        if np.ndim(dt) == 0:
+            rows = range(n)
+        else:
+            dt = np.asarray(dt, dtype=np.float64)
+            rows = np.flatnonzero(dt).tolist()
+        entities = self.entities
+        px, py, vx, vy, ax, ay = (buffer[:n] for buffer in (self.px, self.py, self.vx, self.vy, self.ax, self.ay))
+        stats = {stat: values[:n] for stat, values in self.stats.items()}
+
+        '''GATHER INPUT FLAGS'''
+        left = np.fromiter((entity.left_key for entity in entities), dtype=bool, count=n)
+        right = np.fromiter((entity.right_key for entity in entities), dtype=bool, count=n)
+        running = np.fromiter((entity.is_running for entity in entities), dtype=bool, count=n)
+        jumping = np.fromiter((entity.jumping for entity in entities), dtype=bool, count=n)
+
+        for row in rows:
+            entities[row].previous_hitbox_pos.update(entities[row].entity_hitbox.topleft)
+
+        '''APPLYING WALK ACCELERATION (AND RUNNING BOOST) AND PLAYER TRACTION'''
+        drive = stats['walk_accel'] + np.where(running, stats['run_boost'], 0.0)
+        braking = np.abs(drive - stats['traction'] * np.abs(vx))
+        ax[:] = 0.0
+        ax -= np.where(left, np.where(vx <= 0, drive, braking), 0.0)
+        ax += np.where(~left & right, np.where(vx >= 0, drive, braking), 0.0)
+
+        '''INERTIA PRINCIPLE (ADDING GROUND FRICTION)'''
+        ax += vx * stats['weight'] * (stats['friction'] + stats['slipperiness'] * np.abs(vx / 30))
+
+        '''NEWTON'S MOVEMENT EQUATION (VELOCITY) AND LIMITS'''
+        vx += ax * dt
+        np.copyto(vx, np.clip(vx, -stats['max_x_velocity'], stats['max_x_velocity']), where=~jumping)
+        vx[np.abs(vx) < .18] = 0
+
+        '''NEWTON'S MOVEMENT EQUATION (POSITION) AND ROUNDING'''
+        px += vx * dt + 0.5 * ax * dt**2
+        np.round(px, out=px)
+
+        xs = px.tolist()
+        for row in rows:
+            entity = entities[row]
+            entity.entity_hitbox.x = xs[row]
+            entity.atk_hitbox.x = xs[row]
+            entity._handle_collisions_x(tiles)
+
+        '''Y-AXIS: VELOCITY, FALLING LIMIT AND POSITION'''
+        vy += ay * dt
+        np.minimum(vy, stats['max_y_velocity'], out=vy)
+        py += vy * dt + 0.5 * ay * dt**2
+
+        ys = py.tolist()
+        for row in rows:
+            entity = entities[row]
+            entity.entity_hitbox.bottom = ys[row]
+            entity.atk_hitbox.bottom = ys[row]
+            entity._handle_collisions_y(tiles)
+
+    def _allocate(self, capacity: int) -> None:
+        '''(Re)allocates the buffers keeping the current rows, and rebinds the entities views.'''
+
+        n = len(self.entities)
+        old = self._buffers() if hasattr(self, 'px') else ()
+        self.px, self.py, self.vx, self.vy, self.ax, self.ay = (np.zeros(capacity) for _ in range(6))
+        self.stats = {stat: np.zeros(capacity) for stat in BatchPhysics.STATS}
+        for new_buffer, old_buffer in zip(self._buffers(), old):
+            new_buffer[:n] = old_buffer[:n]
+        self._capacity = capacity
+        for row in range(n):
+            self._bind(row)
+
+    def _buffers(self) -> tuple:
+        return (self.px, self.py, self.vx, self.vy, self.ax, self.ay) + tuple(self.stats.values())
+
+    def _bind(self, row: int) -> None:
+        '''Points the vectors of the entity in a row to the batch buffers.'''
+
+        entity = self.entities[row]
+        entity.position = RowVector(self.px, self.py, row)
+        entity.velocity = RowVector(self.vx, self.vy, row)
+        entity.acceleration = RowVector(self.ax, self.ay, row)
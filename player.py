@@ -1,7 +1,12 @@
 
 
 import pygame
-from texture import SpriteSheet
+import os
+from assets import assets
+from animation import Animator
+from profiler import profiler
+from collision import sweep_rect
+from particles import particles
 from abc import ABC, abstractmethod
 
 
@@ -17,7 +22,7 @@ class Entity(ABC):
 
         '''LOAD TEXTURES'''
         self._load_textures(config)
-        self.entity_image = self.walk_sprites.textures[self.curent_walk_sprite]
+        self.entity_image = self.walk_sprites.textures[0]
         self.entity_hitbox = self.entity_image.get_rect()
         self.atk_hitbox = self.entity_image.get_rect()
 
@@ -26,6 +31,8 @@ class Entity(ABC):
         self.init_y = init_y
         self.position = pygame.math.Vector2(self.init_x, self.init_y)
         self.velocity = pygame.math.Vector2(0, 0)
+        self.entity_hitbox.x, self.entity_hitbox.bottom = self.position.x, self.position.y
+        self.atk_hitbox.x, self.atk_hitbox.bottom = self.position.x, self.position.y
 
         '''PLAYER INPUT'''
         self.left_key = False
@@ -54,6 +61,11 @@ class Entity(ABC):
         self.mass = 0.8
         self.slipperiness = 0.03
 
+        '''TILE COLLISIONS ("discrete" RESOLVES THE TILES OVERLAPPED AFTER EACH AXIS MOVEMENT,
+        "swept" STOPS THE HITBOX AT THE FIRST TILE IT ENTERS ON THE WAY, SO FAST ENTITIES OR
+        LARGE DT CANNOT TUNNEL THROUGH THIN PLATFORMS)'''
+        self.collision_mode = config['game']['collision-mode']
+
         '''LEVEL ATTRIBUTES (MUST BE OVERRIDEN BY ADDING THE PLAYER TO THE LEVEL)'''
         self.gravity = None
         self.friction = None
@@ -63,30 +75,51 @@ class Entity(ABC):
 
         '''RENDER ATTRIBUTES'''
         self.render_pos = pygame.math.Vector2(self.init_x, self.init_y)
+        self.previous_hitbox_pos = pygame.math.Vector2(self.entity_hitbox.topleft)
+        self.dirty_rect = pygame.Rect(0, 0, 0, 0)
         self.trigger_atk_anim = False
         self.trigger_deatk_anim = False
-        self.atk_sprite_count = 0
+
+        '''ANIMATION (TIME BASED, SEE animation.Animator). RUN AND RETRACT PLAY THE WALK AND
+        ATTACK FRAMES FASTER'''
+        self.animator = Animator()
+        self.animator.play(self.walk_animations, 'idle')
+        self.run_animation_speed = config['joel']['run-animation-speed']
+        self.retract_animation_speed = config['joel']['retract-animation-speed']
 
     '''=============  PUBLIC METHODS ==============='''
 
-    def render(self, screen, camera=None, show_hitbox=True) -> None:
-        '''Renders player on the screen.'''
+    def render(self, screen, camera=None, show_hitbox=True, alpha=1.0) -> None:
+        '''Renders player on the screen. alpha interpolates the render position between the
+        previous (0) and the current (1) simulation step.'''
 
         '''SET RENDER POSITION (CAMERA[only if player] AND ATTACK ADJUSTMENT)'''
         if camera is not None:
-            self.render_pos.x = self.entity_hitbox.x - camera.offset.x
-            self.render_pos.y = self.entity_hitbox.y - camera.offset.y
+            self.render_pos.x = round(self.previous_hitbox_pos.x
+                                      + (self.entity_hitbox.x - self.previous_hitbox_pos.x) * alpha) - camera.offset.x
+            self.render_pos.y = round(self.previous_hitbox_pos.y
+                                      + (self.entity_hitbox.y - self.previous_hitbox_pos.y) * alpha) - camera.offset.y
         if self.facing_left and (self.trigger_atk_anim or self.trigger_deatk_anim):
             self.render_pos.x -= (self.scale * 32)
 
+        '''SKIP ENTITIES OUTSIDE THE SCREEN (NO ANIMATION OR IMAGE UPDATE). THE TEST AREA IS
+        THE HITBOX GROWN BY ITS SIZE ON EVERY SIDE, WHICH COVERS THE WIDER ATTACK FRAMES'''
+        if camera is not None:
+            area = pygame.Rect(self.entity_hitbox.x - camera.offset.x - self.entity_hitbox.w,
+                               self.entity_hitbox.y - camera.offset.y - self.entity_hitbox.h,
+                               3 * self.entity_hitbox.w, 3 * self.entity_hitbox.h)
+            if not screen.get_rect().colliderect(area):
+                self.dirty_rect = pygame.Rect(self.render_pos, (0, 0))
+                return
+
+        '''ANIMATION CONTROL'''
+        self._animate()
+
         '''CREATE IMAGE'''
         self._create_image()
 
-        '''SPRITE COUNT CONTROL'''
-        self._animate()
-
-        '''RENDER CALL'''
-        screen.blit(self.entity_image, self.render_pos)
+        '''RENDER CALL (KEEPS THE SCREEN REGION TOUCHED, SEE renderer.DirtyRectRenderer)'''
+        self.dirty_rect = screen.blit(self.entity_image, self.render_pos)
 
         '''DRAW HITBOX (GOOD FOR DEBUG PURPOSES)'''
         if show_hitbox:
@@ -102,10 +135,18 @@ class Entity(ABC):
                 pygame.draw.rect(screen,(255,0,0),rect2,border_radius=1,width=1)
             if self.is_colliding_entities:
                 pygame.draw.rect(screen,(0,0,255),rect2,border_radius=1,width=1)
+            if self.is_colliding_tiles or self.is_colliding_entities:
+                self.dirty_rect.union_ip(rect2)
 
-    def update(self, dt, tiles, entities) -> None:
+    def update(self, dt, tiles, entities=None) -> None:
         '''Calls horizontal and vertical movement functions that calculates
-        the increment on the X and Y position for a given dt.'''
+        the increment on the X and Y position for a given dt.
+        tiles is the level collision grid (see collision.SpatialGrid). If a list of entities
+        hitboxes is given, the attack hitbox is also checked against them (Game.update checks
+        every pair at once with a broadphase instead).'''
+
+        '''KEEP LAST STEP POSITION FOR RENDER INTERPOLATION'''
+        self.previous_hitbox_pos.update(self.entity_hitbox.topleft)
 
         '''MOVEMENT UPDATE'''
         self._horizontal_movement(dt)
@@ -114,7 +155,8 @@ class Entity(ABC):
         self._handle_collisions_y(tiles)
 
         '''COLLISION WITH ENTITIES'''
-        self._handle_entity_collisions(entities)
+        if entities is not None:
+            self._handle_entity_collisions(entities)
 
     def jump(self) -> None:
         '''Calculates y position and velocity after jumping action.'''
@@ -137,6 +179,7 @@ class Entity(ABC):
 
             '''NOT JUMP AGAIN UNTIL COMPLETE THE FALLING'''
             self.on_ground = False
+            particles.emit('jump', self.entity_hitbox.centerx, self.entity_hitbox.bottom)
 
     def dash(self) -> None:
         '''Controls the player's dash action.'''
@@ -144,20 +187,29 @@ class Entity(ABC):
         if self.on_ground is False and self.jumping is False and self.velocity.y > 0:
             self.is_dashing = True
             self.velocity.y -= self.dash_force / self.weight
+            particles.emit('dash', self.entity_hitbox.centerx, self.entity_hitbox.bottom)
 
     def reset(self) -> None:
         self.position.x, self.position.y = self.init_x, self.init_y
+        self.entity_hitbox.x, self.entity_hitbox.bottom = self.position.x, self.position.y
+        self.previous_hitbox_pos.update(self.entity_hitbox.topleft)
         self.facing_left = False
-        self.curent_walk_sprite = 0
+        self.animator.play(self.walk_animations, 'idle')
         self.velocity.x, self.velocity.y = 0, 0
 
     def attack(self):
+        '''Starts an attack (pressing again while the last one retracts starts it over).'''
+
         if self.ready_to_atk:
-            self.atk_sprite_count = 0
             self.is_attacking = True
             self.trigger_atk_anim = True
+            self.trigger_deatk_anim = False
             self.ready_to_atk = False
             self.atk_hitbox.w = self.width*2.2
+            particles.emit('attack',
+                           self.entity_hitbox.left if self.facing_left else self.entity_hitbox.right,
+                           self.entity_hitbox.centery,
+                           facing_left=self.facing_left)
 
     @abstractmethod
     def control(self, event) -> None:
@@ -165,39 +217,35 @@ class Entity(ABC):
 
     '''=============  PRIVATE METHODS ==============='''
 
+    def release_textures(self) -> None:
+        '''Releases the shared spritesheets and animations of the entity and its animation
+        clock (call it when removing the entity).'''
+
+        for asset in self._spritesheets() + self._animations():
+            assets.release(asset)
+        self.animator.release()
+
     @abstractmethod
     def _load_textures(self, config) -> None:
         pass
 
+    @abstractmethod
+    def _spritesheets(self) -> list:
+        pass
+
+    @abstractmethod
+    def _animations(self) -> list:
+        pass
+
+    @staticmethod
+    def _animation_file(sheet_filename: str) -> str:
+        '''Animation metadata of a spritesheet: its Aseprite json export, next to it.'''
+
+        return os.path.splitext(sheet_filename)[0] + '.json'
+
     def _animate(self) -> None:
-        '''Controls character several animations.'''
-
-        '''LEFT AND RIGHT ANIMATION'''
-        if self.left_key or self.right_key:
-            if self.on_ground:
-                if self.curent_walk_sprite > self.n_walk_sprites:
-                    self.curent_walk_sprite = 0  #avoid getting too big, although modulo handles list index
-                if self.is_running:
-                    self.curent_walk_sprite += 0.25
-                else:
-                    self.curent_walk_sprite += 0.15
-                self.curent_walk_sprite = self.curent_walk_sprite % self.n_walk_sprites
-        if self.left_key is False and self.right_key is False:
-            self.curent_walk_sprite = 0
-
-        '''JUMPING ANIMATION'''
-        if self.jumping is True and self.on_ground is False:
-            self.curent_walk_sprite = self.n_walk_sprites-1
-
-        '''DASH ANIMATION'''
-        if self.is_dashing:
-            if self.current_dash_sprite > self.n_dash_sprites:
-                self.current_dash_sprite = 0
-            else:
-                self.current_dash_sprite += 0.09
-            self.current_dash_sprite = self.current_dash_sprite % self.n_dash_sprites
-        else:
-            self.current_dash_sprite = 0
+        '''Controls character several animations: picks the animation of the current state.
+        The frame shown comes from the animation clock (see animation.Animator).'''
 
         '''FACING LEFT-RIGHT ANIMATION'''
         if self.left_key:
@@ -205,47 +253,52 @@ class Entity(ABC):
         elif self.right_key:
             self.facing_left = False
 
-        '''ATTACK ANIMATION'''
+        '''ATTACK, THEN DE-ATTACK ANIMATION (ONLY ONE OF THE TWO PLAYS PER FRAME)'''
         if self.trigger_atk_anim:
-            if self.atk_sprite_count < self.n_atk_sprites-1:
-                self.atk_sprite_count += 0.4
-                self.current_atk_sprite = self.atk_sprite_count
-            else:
-                self.current_atk_sprite = 0
+            self.animator.play(self.atk_animations, 'attack', loop=False)
+            if self.animator.finished:
                 self.trigger_atk_anim = False
                 self.trigger_deatk_anim = True
-        else:
-            self.current_atk_sprite = 0
-
-        '''DE-ATTACK ANIMATION'''
-        if self.trigger_deatk_anim:
-            if self.atk_sprite_count > 0:
-                self.atk_sprite_count -= 0.6
-                self.current_atk_sprite = self.atk_sprite_count
-            else:
-                self.current_atk_sprite = 0
+        elif self.trigger_deatk_anim:
+            self.animator.play(self.atk_animations, 'retract', self.retract_animation_speed, loop=False)
+            if self.animator.finished:
                 self.trigger_deatk_anim = False
                 self.atk_hitbox.w = self.entity_hitbox.w
+        if self.trigger_atk_anim or self.trigger_deatk_anim:
+            return
 
-    def _create_image(self) -> None:
-        '''Creates the image of Joel based on which sprite is activated.'''
-
-        self.entity_image = pygame.transform.flip(self.walk_sprites.textures[int(self.curent_walk_sprite)],
-                                                  flip_x=self.facing_left,
-                                                  flip_y=False)
-
+        '''DASH, JUMPING, LEFT AND RIGHT (PAUSED WHILE FALLING) AND IDLE ANIMATIONS'''
         if self.is_dashing and self.velocity.y < 0:
-            self.entity_image = pygame.transform.flip(self.dash_sprites.textures[int(self.current_dash_sprite)],
-                                                      flip_x=self.facing_left,
-                                                      flip_y=False)
+            self.animator.play(self.dash_animations, 'dash')
+        elif self.jumping is True and self.on_ground is False:
+            self.animator.play(self.walk_animations, 'jump')
+        elif self.left_key or self.right_key:
+            if not self.on_ground:
+                self.animator.play(self.walk_animations, 'walk', speed=0)
+            elif self.is_running:
+                self.animator.play(self.walk_animations, 'walk', self.run_animation_speed)
+            else:
+                self.animator.play(self.walk_animations, 'walk')
+        else:
+            self.animator.play(self.walk_animations, 'idle')
+
+    def _create_image(self) -> None:
+        '''Creates the image of Joel based on which sprite is activated.
+        Left facing sprites are looked up in the flipped textures cached by the sprite sheets.'''
 
         if self.trigger_atk_anim or self.trigger_deatk_anim:
-            self.entity_image = pygame.transform.flip(self.atk_sprites.textures[int(self.current_atk_sprite)],
-                                                      flip_x=self.facing_left,
-                                                      flip_y=False)
+            self.entity_image = self.atk_sprites.get(self.animator.frame, self.facing_left)
+        elif self.is_dashing and self.velocity.y < 0:
+            self.entity_image = self.dash_sprites.get(self.animator.frame, self.facing_left)
+        else:
+            self.entity_image = self.walk_sprites.get(self.animator.frame, self.facing_left)
 
     def _handle_collisions_x(self, tiles) -> None:
-        tiles_collided = self._get_hits(self.entity_hitbox,tiles)
+        if self.collision_mode == 'swept':
+            self._sweep_collisions_x(tiles)
+            return
+
+        tiles_collided = self._get_hits(self.entity_hitbox, tiles.query(self.entity_hitbox))
 
         if len(tiles_collided) > 0:
             self.is_colliding_tiles = True
@@ -262,9 +315,14 @@ class Entity(ABC):
             self.velocity.x = 0
 
     def _handle_collisions_y(self, tiles):
+        if self.collision_mode == 'swept':
+            self._sweep_collisions_y(tiles)
+            return
+
+        landing = not self.on_ground
         self.on_ground = False
         self.entity_hitbox.bottom += 1
-        tiles_collided = self._get_hits(self.entity_hitbox,tiles)
+        tiles_collided = self._get_hits(self.entity_hitbox, tiles.query(self.entity_hitbox))
 
         if len(tiles_collided) > 0:
             self.is_colliding_tiles = True
@@ -273,6 +331,58 @@ class Entity(ABC):
 
         for tile in tiles_collided:
             if self.velocity.y > 0:  # Hit tile from the top
+                if landing and not self.on_ground:
+                    particles.emit('landing', self.entity_hitbox.centerx, tile.rect.top)
+                self.on_ground = True
+                self.is_jumping = False
+                self.velocity.y = 0
+                self.position.y = tile.rect.top
+                self.entity_hitbox.bottom = self.position.y
+            elif self.velocity.y < 0:  # Hit tile from the bottom
+                self.velocity.y = 0
+                self.position.y = tile.rect.bottom + self.entity_hitbox.h
+                self.entity_hitbox.bottom = self.position.y
+
+    def _sweep_collisions_x(self, tiles) -> None:
+        '''Swept version of _handle_collisions_x: the hitbox moves from its last step position
+        and only the tiles inside the swept box are tested.'''
+
+        start = pygame.Rect((self.previous_hitbox_pos.x, self.entity_hitbox.y), self.entity_hitbox.size)
+        dx = self.entity_hitbox.x - start.x
+        candidates = tiles.query(start.union(self.entity_hitbox))
+        if profiler.enabled:
+            profiler.count('collision_tests', len(candidates))
+        _, tile, _ = sweep_rect(start, dx, 0, candidates)
+
+        self.is_colliding_tiles = tile is not None
+        if tile is not None:
+            if dx > 0:    # Hit tile moving right
+                self.position.x = tile.rect.left - self.entity_hitbox.w
+            else:         # Hit tile moving left
+                self.position.x = tile.rect.right
+            self.entity_hitbox.x = self.position.x
+            self.velocity.x = 0
+
+    def _sweep_collisions_y(self, tiles) -> None:
+        '''Swept version of _handle_collisions_y (with the same 1 pixel ground probe when not
+        moving up).'''
+
+        landing = not self.on_ground
+        self.on_ground = False
+        start = pygame.Rect((self.entity_hitbox.x, self.previous_hitbox_pos.y), self.entity_hitbox.size)
+        dy = self.entity_hitbox.y - start.y
+        if self.velocity.y >= 0:
+            dy += 1
+        candidates = tiles.query(start.union(start.move(0, dy)))
+        if profiler.enabled:
+            profiler.count('collision_tests', len(candidates))
+        _, tile, _ = sweep_rect(start, 0, dy, candidates)
+
+        self.is_colliding_tiles = tile is not None
+        if tile is not None:
+            if self.velocity.y > 0:  # Hit tile from the top
+                if landing and not self.on_ground:
+                    particles.emit('landing', self.entity_hitbox.centerx, tile.rect.top)
                 self.on_ground = True
                 self.is_jumping = False
                 self.velocity.y = 0
@@ -291,6 +401,11 @@ class Entity(ABC):
             self.is_colliding_entities = False
 
     def _get_hits(self, hitbox, tiles: list) -> list:
+        '''Returns the objects in tiles that overlap hitbox. For tiles, pass only the
+        candidates returned by the level collision grid.'''
+
+        if profiler.enabled:
+            profiler.count('collision_tests', len(tiles))
         hits = []
         for tile in tiles:
             if hitbox.colliderect(tile):
@@ -414,28 +529,34 @@ class Joel(Entity):
         '''Loads player's textures.'''
 
         '''WALK SPRITES'''
-        self.walk_sprites = SpriteSheet(filename=config['joel']['walk_sheet'],
-                                        tile_size=(config['joel']['tile-size'], config['joel']['tile-size']),
-                                        scale=self.scale,
-                                        dimension=(1, config['joel']['walk-sheet-size']))
-        self.n_walk_sprites = len(self.walk_sprites.textures)
-        self.curent_walk_sprite = 0
+        self.walk_sprites = assets.spritesheet(filename=config['joel']['walk_sheet'],
+                                               tile_size=(config['joel']['tile-size'], config['joel']['tile-size']),
+                                               scale=self.scale,
+                                               dimension=(1, config['joel']['walk-sheet-size']),
+                                               flippable=True)
+        self.walk_animations = assets.animation(self._animation_file(config['joel']['walk_sheet']))
 
         '''ATTACK SPRITES'''
-        self.atk_sprites = SpriteSheet(filename=config['joel']['atk_sheet'],
-                                       tile_size=(64, config['joel']['tile-size']),
-                                       scale=self.scale,
-                                       dimension=(1, config['joel']["atk-sheet-size"]))
-        self.n_atk_sprites = len(self.atk_sprites.textures)
-        self.current_atk_sprite = 0
+        self.atk_sprites = assets.spritesheet(filename=config['joel']['atk_sheet'],
+                                              tile_size=(64, config['joel']['tile-size']),
+                                              scale=self.scale,
+                                              dimension=(1, config['joel']["atk-sheet-size"]),
+                                              flippable=True)
+        self.atk_animations = assets.animation(self._animation_file(config['joel']['atk_sheet']))
 
         '''DASH SPRITES'''
-        self.dash_sprites = SpriteSheet(filename=config['joel']['dash_sheet'],
-                                        tile_size=(config['joel']['tile-size'], 64),
-                                        scale=self.scale,
-                                        dimension=(1, config['joel']['dash-sheet-size']))
-        self.n_dash_sprites = len(self.dash_sprites.textures)
-        self.current_dash_sprite = 0
+        self.dash_sprites = assets.spritesheet(filename=config['joel']['dash_sheet'],
+                                               tile_size=(config['joel']['tile-size'], 64),
+                                               scale=self.scale,
+                                               dimension=(1, config['joel']['dash-sheet-size']),
+                                               flippable=True)
+        self.dash_animations = assets.animation(self._animation_file(config['joel']['dash_sheet']))
+
+    def _spritesheets(self) -> list:
+        return [self.walk_sprites, self.atk_sprites, self.dash_sprites]
+
+    def _animations(self) -> list:
+        return [self.walk_animations, self.atk_animations, self.dash_animations]
 
 
 
@@ -450,11 +571,16 @@ class Kittol(Entity):
     def _load_textures(self, config) -> None:
         '''Loads enemy's textures.'''
 
-        self.walk_sprites = SpriteSheet(filename=config['kittol']['walk_sheet'],
-                                        tile_size=(config['kittol']['tile-size'],
-                                                   config['kittol']['tile-size']),
-                                        scale=self.scale,
-                                        dimension=(1, 1))
-        self.n_walk_sprites = len(self.walk_sprites.textures)
-        self.curent_walk_sprite = 0
+        self.walk_sprites = assets.spritesheet(filename=config['kittol']['walk_sheet'],
+                                               tile_size=(config['kittol']['tile-size'],
+                                                          config['kittol']['tile-size']),
+                                               scale=self.scale,
+                                               dimension=(1, 1),
+                                               flippable=True)
+        self.walk_animations = assets.animation(self._animation_file(config['kittol']['walk_sheet']))
+
+    def _spritesheets(self) -> list:
+        return [self.walk_sprites]
 
+    def _animations(self) -> list:
+        return [self.walk_animations]
@@ -0,0 +1,126 @@
+import pygame
+import json
+import csv
+import time
+from collections import deque
+
+
+class FrameProfiler:
+
+    PHASES = ('handle_events', 'update', 'level_render', 'entity_render', 'overlay', 'flip')
+    COUNTERS = ('collision_tests', 'blits')
+
+    def __init__(self, window: int = 300, trace_length: int = 36000) -> None:
+        '''Times the phases of every frame and counts collision tests and blits. Keeps the last
+        "window" frames for rolling percentiles (shown by draw_overlay) and, while enabled, the
+        per-frame trace of the last trace_length frames (written by export). Every method returns
+        right away when disabled, and hot paths check "enabled" before counting.'''
+
+        self.enabled = False
+        self.window = window
+        self.history = {name: deque(maxlen=window) for name in FrameProfiler.PHASES + FrameProfiler.COUNTERS + ('frame',)}
+        self.trace = deque(maxlen=trace_length)
+        self.counters = dict.fromkeys(FrameProfiler.COUNTERS, 0)
+        self._times = dict.fromkeys(FrameProfiler.PHASES, 0.0)
+        self._frame_start = 0.0
+        self._last = 0.0
+        self._font = None
+        self._overlay = None
+        self._overlay_age = 0
+
+    def toggle(self) -> None:
+        self.enabled = not self.enabled
+        self._overlay = None
+
+    def begin_frame(self) -> None:
+        '''Starts timing a frame (call it right after the frame rate wait).'''
+
+        if not self.enabled:
+            return
+        self._frame_start = self._last = time.perf_counter()
+        for name in FrameProfiler.COUNTERS:
+            self.counters[name] = 0
+        for phase in FrameProfiler.PHASES:
+            self._times[phase] = 0.0
+
+    def mark(self, phase: str) -> None:
+        '''Ends a phase: the time since the previous mark (or the frame start) is added to it.'''
+
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._times[phase] += now - self._last
+        self._last = now
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += n
+
+    def end_frame(self) -> None:
+        '''Stores the frame phase times (in ms) and counters.'''
+
+        if not self.enabled:
+            return
+        row = {phase: self._times[phase] * 1000 for phase in FrameProfiler.PHASES}
+        row.update(self.counters)
+        row['frame'] = (time.perf_counter() - self._frame_start) * 1000
+        for name, value in row.items():
+            self.history[name].append(value)
+        self.trace.append(row)
+
+    def percentiles(self, name: str) -> tuple:
+        '''Returns the (p50, p95, p99) of a phase or counter over the last frames.'''
+
+        values = sorted(self.history[name])
+        if not values:
+            return 0, 0, 0
+        last = len(values) - 1
+        return tuple(values[min(int(q * len(values)), last)] for q in (0.50, 0.95, 0.99))
+
+    def draw_overlay(self, screen: pygame.Surface) -> pygame.Rect:
+        '''Draws the rolling percentiles in the upper left corner of the screen and returns the
+        screen region drawn (None when disabled). The text is re-rendered every 15 frames.'''
+
+        if not self.enabled:
+            return None
+        if self._overlay is None or self._overlay_age >= 15:
+            self._overlay = self._render_overlay()
+            self._overlay_age = 0
+        self._overlay_age += 1
+        return screen.blit(self._overlay, (4, 4))
+
+    def export(self, filename: str) -> None:
+        '''Writes the per-frame trace as csv or json (chosen by the file extension).'''
+
+        columns = ('frame',) + FrameProfiler.PHASES + FrameProfiler.COUNTERS
+        if filename.endswith('.json'):
+            with open(filename, 'w') as json_file:
+                json.dump({'columns': columns, 'frames': list(self.trace)}, json_file)
+        else:
+            with open(filename, 'w', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(self.trace)
+        print(f'profile trace ({len(self.trace)} frames) saved to {filename}')
+
+    def _render_overlay(self) -> pygame.Surface:
+        if self._font is None:
+            pygame.font.init()
+            self._font = pygame.font.SysFont('monospace', 14)
+
+        lines = [f'{"":14} {"p50":>7} {"p95":>7} {"p99":>7}']
+        for name in ('frame',) + FrameProfiler.PHASES + FrameProfiler.COUNTERS:
+            unit = '' if name in FrameProfiler.COUNTERS else 'ms'
+            lines.append(f'{name:14} ' + ' '.join(f'{value:>5.{0 if not unit else 2}f}{unit:2}'
+                                                   for value in self.percentiles(name)))
+
+        height = self._font.get_linesize()
+        overlay = pygame.Surface((360, height * len(lines) + 8))
+        overlay.set_alpha(200)
+        for i, line in enumerate(lines):
+            overlay.blit(self._font.render(line, True, (255, 255, 255)), (4, 4 + i * height))
+        return overlay
+
+
+'''SHARED PROFILER (ENTITIES AND LEVELS COUNT THEIR COLLISION TESTS AND BLITS HERE)'''
+profiler = FrameProfiler()
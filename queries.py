@@ -0,0 +1,153 @@
+import pygame
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, raycast_batch falls back to one raycast per ray
+    np = None
+
+
+'''QUERIES OVER THE COLLISION LAYER CELLS (Level.collision_tile), IN LEVEL PIXELS. THEIR COST
+ONLY DEPENDS ON THE NUMBER OF CELLS THEY TRAVERSE (CELLS OF STREAMING CHUNKS THAT ARE NOT LOADED
+ARE EMPTY)'''
+
+
+def solid_at(level, x: float, y: float) -> bool:
+    '''Whether the point is inside a solid cell.'''
+
+    size = level.tile_size
+    return level.collision_tile(int(x // size), int(y // size)) != -1
+
+
+def rect_occupied(level, rect: pygame.Rect) -> bool:
+    '''Whether any cell overlapped by rect is solid.'''
+
+    size = level.tile_size
+    for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+        for col in range(rect.left // size, (rect.right - 1) // size + 1):
+            if level.collision_tile(col, row) != -1:
+                return True
+    return False
+
+
+def first_solid_below(level, x: float, y: float, max_distance: float = None):
+    '''Returns the top (y) of the first solid cell containing or below the point, scanning its
+    column down to the bottom of the level or max_distance pixels. None if there is no ground.'''
+
+    size = level.tile_size
+    col, row = int(x // size), int(y // size)
+    last_row = level.n_rows - 1
+    if max_distance is not None:
+        last_row = min(last_row, int((y + max_distance) // size))
+    for row in range(max(row, 0), last_row + 1):
+        if level.collision_tile(col, row) != -1:
+            return row * size
+    return None
+
+
+def ledge_ahead(level, hitbox: pygame.Rect, facing_left: bool, max_drop: float) -> bool:
+    '''Whether there is no ground within max_drop pixels right in front of the feet of hitbox.'''
+
+    x = hitbox.left - 1 if facing_left else hitbox.right
+    return first_solid_below(level, x, hitbox.bottom, max_drop) is None
+
+
+def raycast(level, x0: float, y0: float, x1: float, y1: float):
+    '''Walks the cells crossed by the segment from (x0, y0) to (x1, y1), in order (DDA grid
+    traversal). Returns (t, x, y, col, row) for the first solid cell it enters, t being the
+    fraction of the segment at the entry point (x, y), or None if the segment is clear.'''
+
+    size = level.tile_size
+    dx, dy = x1 - x0, y1 - y0
+    col, row = int(x0 // size), int(y0 // size)
+    end_col, end_row = int(x1 // size), int(y1 // size)
+
+    '''RAY PARAMETER AT THE NEXT VERTICAL / HORIZONTAL CELL BORDER AND BETWEEN TWO BORDERS'''
+    inf = float('inf')
+    step_col, step_row = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+    t_max_x = ((col + (dx > 0)) * size - x0) / dx if dx else inf
+    t_max_y = ((row + (dy > 0)) * size - y0) / dy if dy else inf
+    t_delta_x = size / abs(dx) if dx else inf
+    t_delta_y = size / abs(dy) if dy else inf
+
+    t = 0.0
+    while True:
+        if level.collision_tile(col, row) != -1:
+            return t, x0 + dx * t, y0 + dy * t, col, row
+        if col == end_col and row == end_row:
+            return None
+        if t_max_x < t_max_y:
+            t, t_max_x, col = t_max_x, t_max_x + t_delta_x, col + step_col
+        else:
+            t, t_max_y, row = t_max_y, t_max_y + t_delta_y, row + step_row
+        if t > 1:
+            return None
+
+
+def line_of_sight(level, x0: float, y0: float, x1: float, y1: float) -> bool:
+    '''Whether no solid cell lies between the two points.'''
+
+    return raycast(level, x0, y0, x1, y1) is None
+
+
+def raycast_batch(level, x0, y0, x1, y1) -> tuple:
+    '''Casts many rays at once (arrays of start and end points, one per ray), advancing every
+    ray one cell per vectorized step. Returns the (hit, t, col, row) arrays: whether each ray
+    hit a solid cell, and the segment fraction and cell of the hit (t is 1 for clear rays).
+    Without numpy, or on levels without a whole collision grid, casts the rays one by one.'''
+
+    grid = level.collision_layer()
+    if np is None or grid is None:
+        hits = [raycast(level, *ray) for ray in zip(x0, y0, x1, y1)]
+        arrays = ([hit is not None for hit in hits], [hit[0] if hit else 1.0 for hit in hits],
+                  [hit[3] if hit else -1 for hit in hits], [hit[4] if hit else -1 for hit in hits])
+        return tuple(np.array(values) for values in arrays) if np is not None else arrays
+
+    size, n_cols, n_rows = level.tile_size, level.n_cols, level.n_rows
+    grid = np.frombuffer(grid, dtype=np.int16).reshape(n_rows, n_cols)
+    x0, y0, x1, y1 = (np.asarray(values, dtype=np.float64) for values in (x0, y0, x1, y1))
+    dx, dy = x1 - x0, y1 - y0
+    col, row = np.floor_divide(x0, size).astype(np.int64), np.floor_divide(y0, size).astype(np.int64)
+    end_col, end_row = np.floor_divide(x1, size).astype(np.int64), np.floor_divide(y1, size).astype(np.int64)
+
+    '''SAME DDA SETUP AS raycast, PER RAY'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step_col, step_row = np.where(dx > 0, 1, -1), np.where(dy > 0, 1, -1)
+        t_max_x = np.where(dx != 0, ((col + (dx > 0)) * size - x0) / dx, np.inf)
+        t_max_y = np.where(dy != 0, ((row + (dy > 0)) * size - y0) / dy, np.inf)
+        t_delta_x = np.where(dx != 0, size / np.abs(dx), np.inf)
+        t_delta_y = np.where(dy != 0, size / np.abs(dy), np.inf)
+
+    n = len(x0)
+    hit = np.zeros(n, dtype=bool)
+    hit_t, hit_col, hit_row = np.ones(n), np.full(n, -1), np.full(n, -1)
+    rays = [np.arange(n), np.zeros(n), col, row, end_col, end_row, step_col, step_row,
+            t_max_x, t_max_y, t_delta_x, t_delta_y]
+    active = np.ones(n, dtype=bool)
+
+    '''ADVANCE EVERY ACTIVE RAY ONE CELL PER STEP'''
+    while True:
+        ids, t, col, row, end_col, end_row, step_col, step_row, t_max_x, t_max_y, t_delta_x, t_delta_y = rays
+        solid = active & (col >= 0) & (col < n_cols) & (row >= 0) & (row < n_rows)
+        solid[solid] = grid[row[solid], col[solid]] != -1
+        hit_ids = ids[solid]
+        hit[hit_ids] = True
+        hit_t[hit_ids], hit_col[hit_ids], hit_row[hit_ids] = t[solid], col[solid], row[solid]
+
+        active &= ~solid & ((col != end_col) | (row != end_row))
+        along_x = active & (t_max_x < t_max_y)
+        along_y = active & ~along_x
+        np.copyto(t, t_max_x, where=along_x)
+        np.copyto(t, t_max_y, where=along_y)
+        col += along_x * step_col
+        row += along_y * step_row
+        t_max_x += np.where(along_x, t_delta_x, 0)
+        t_max_y += np.where(along_y, t_delta_y, 0)
+        active &= t <= 1
+
+        '''DROP THE FINISHED RAYS FROM THE STATE ARRAYS ONCE THEY ARE THE MAJORITY'''
+        n_active = np.count_nonzero(active)
+        if n_active == 0:
+            return hit, hit_t, hit_col, hit_row
+        if 2 * n_active < len(active):
+            rays = [values[active] for values in rays]
+            active = np.ones(n_active, dtype=bool)
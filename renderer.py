@@ -0,0 +1,78 @@
+import pygame
+from profiler import profiler
+from latency import latency
+from particles import particles
+
+
+class DirtyRectRenderer:
+
+    def __init__(self, screen: pygame.Surface) -> None:
+        '''Renders only the screen regions that changed since the last frame: the regions the
+        entities, the particles (and the profiler overlay) were drawn on are restored from the
+        level chunks, everything is drawn again and only the old and new regions are pushed to
+        the display with pygame.display.update(rects). Falls back to a full redraw and flip
+        when the camera scrolls or after invalidate (e.g. a new level was loaded).'''
+
+        self.screen = screen
+        self._last_offset = None
+        self._last_rects = []
+        self._level_rects = []
+
+    def invalidate(self, rect: pygame.Rect = None) -> None:
+        '''Forces a full redraw on the next frame, or only the redraw of a level region (in
+        level coordinates, e.g. an edited tile).'''
+
+        if rect is None:
+            self._last_offset = None
+        else:
+            self._level_rects.append(rect)
+
+    def render(self, level, camera, entities: list, alpha: float = 1.0) -> None:
+        screen = self.screen
+        offset = (camera.offset.x, camera.offset.y)
+        full_redraw = offset != self._last_offset
+
+        '''RESTORE THE LEVEL (EVERYTHING OR ONLY THE REGIONS DRAWN ON IN THE LAST FRAME AND THE
+        INVALIDATED LEVEL REGIONS)'''
+        if full_redraw:
+            screen.fill((0,0,0))
+            level.render(screen, camera)
+        else:
+            restored = self._last_rects + [rect.move(-offset[0], -offset[1]) for rect in self._level_rects]
+            for rect in restored:
+                screen.set_clip(rect)
+                screen.fill((0,0,0))
+                level.render(screen, camera, area=rect)
+            screen.set_clip(None)
+        profiler.mark('level_render')
+
+        '''RENDER ENTITIES'''
+        rects = []
+        for entity in entities:
+            entity.render(screen, camera, alpha=alpha)
+            rects.append(entity.dirty_rect)
+        particle_rect = particles.render(screen, camera)
+        if particle_rect is not None:
+            rects.append(particle_rect)
+        if profiler.enabled:
+            profiler.count('blits', len(entities) + particles.count)
+        profiler.mark('entity_render')
+
+        '''PROFILER OVERLAY'''
+        overlay = profiler.draw_overlay(screen)
+        if overlay is not None:
+            rects.append(overlay)
+        profiler.mark('overlay')
+        latency.rendered()
+
+        '''PUSH THE CHANGED REGIONS (OLD AND NEW) TO THE DISPLAY'''
+        if full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(restored + rects)
+        latency.flipped()
+        profiler.mark('flip')
+
+        self._last_offset = offset
+        self._last_rects = rects
+        self._level_rects = []
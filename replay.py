@@ -0,0 +1,93 @@
+import pygame
+import json
+import csv
+import time
+
+
+RECORDED_EVENT_TYPES = {pygame.KEYDOWN: 'KEYDOWN', pygame.KEYUP: 'KEYUP'}
+
+
+class InputRecorder:
+
+    def __init__(self, filename: str, level_name: str) -> None:
+        '''Records the input events consumed by the player control, tagged with the simulation
+        step they are applied before, so a run can be replayed deterministically.'''
+
+        self.filename = filename
+        self.level_name = level_name
+        self.events = []
+
+    def record(self, step: int, event: pygame.event.Event) -> None:
+        '''Records a KEYDOWN/KEYUP event (other events are not consumed by Joel.control).'''
+
+        if event.type in RECORDED_EVENT_TYPES:
+            self.events.append([step, RECORDED_EVENT_TYPES[event.type], event.key])
+
+    def save(self, n_steps: int) -> None:
+        '''Writes the recording as json.'''
+
+        with open(self.filename, 'w') as json_file:
+            json.dump({'level': self.level_name, 'steps': n_steps, 'events': self.events}, json_file)
+
+
+class TraceWriter:
+
+    def __init__(self, filename: str) -> None:
+        '''Writes one csv row per entity and simulation step with its position and velocity.
+        Two traces of the same recording can be diffed to compare physics versions.'''
+
+        self._file = open(filename, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['step', 'entity', 'x', 'y', 'vx', 'vy', 'on_ground'])
+
+    def sample(self, step: int, entities: list) -> None:
+        '''Writes the current state of every entity.'''
+
+        for i, entity in enumerate(entities):
+            self._writer.writerow([step, i,
+                                   f'{entity.position.x:.6f}', f'{entity.position.y:.6f}',
+                                   f'{entity.velocity.x:.6f}', f'{entity.velocity.y:.6f}',
+                                   int(entity.on_ground)])
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def load_recording(filename: str) -> dict:
+    '''Loads a recording and groups its events by simulation step.'''
+
+    with open(filename) as json_file:
+        recording = json.load(json_file)
+
+    event_types = {name: event_type for event_type, name in RECORDED_EVENT_TYPES.items()}
+    recording['events_per_step'] = {}
+    for step, event_type, key in recording['events']:
+        event = pygame.event.Event(event_types[event_type], key=key)
+        recording['events_per_step'].setdefault(step, []).append(event)
+    return recording
+
+
+def replay(config: dict, recording_filename: str, trace_filename: str = None, n_steps: int = None) -> None:
+    '''Replays a recording in a headless game as fast as the CPU allows, optionally writing a
+    position/velocity trace of every entity.'''
+
+    from game import Game
+    recording = load_recording(recording_filename)
+    n_steps = recording['steps'] if n_steps is None else n_steps
+
+    game = Game(config=config, headless=True)
+    game.load_map(level_name=recording['level'])
+    trace = TraceWriter(trace_filename) if trace_filename else None
+
+    start_time = time.perf_counter()
+    for step in range(n_steps):
+        for event in recording['events_per_step'].get(step, ()):
+            game.player.control(event)
+        game.update()
+        if trace is not None:
+            trace.sample(step, game.group)
+
+    if trace is not None:
+        trace.close()
+    elapsed = time.perf_counter() - start_time
+    print(f'replayed {n_steps} steps in {elapsed:.2f} s ({n_steps / max(elapsed, 1e-9):.0f} steps/s)')
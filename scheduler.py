@@ -0,0 +1,90 @@
+import pygame
+
+
+class EntityScheduler:
+
+    def __init__(self, margin: int, far_interval: int) -> None:
+        '''Decides which entities are updated on every simulation step, in three tiers:
+        entities inside the camera viewport plus margin pixels (and the focus entity, usually
+        the player) are updated every step; entities farther away are updated every
+        far_interval steps with a far_interval times larger dt (staggered over the steps, so
+        the cost is spread evenly); far entities at rest on the ground go to sleep and are not
+        updated at all until they come into range, start moving on their own (e.g. AI input)
+        or are woken up (see wake and wake_rect). The far steps of an entity are staggered by
+        the phase it gets when added (see add), so they do not depend on the list it is
+        scheduled in.'''
+
+        self.margin = margin
+        self.far_interval = far_interval
+        self.asleep = set()
+        self.counts = {'near': 0, 'far': 0, 'asleep': 0}
+        self._woken = set()
+        self._phases = {}
+
+    def add(self, entity) -> None:
+        '''Gives an entity its stagger phase (entities scheduled without being added get one
+        the first time they are scheduled).'''
+
+        self._phases.setdefault(entity, len(self._phases))
+
+    def schedule(self, entities: list, view: pygame.Rect, dt: float, step: int, focus=None) -> list:
+        '''Returns the dt every entity must be updated with on this step (0 if it is not
+        updated), in the order of entities. view is the camera viewport in level coordinates.'''
+
+        near_area = view.inflate(2 * self.margin, 2 * self.margin)
+        interval = self.far_interval
+        asleep, woken, phases = self.asleep, self._woken, self._phases
+        counts = dict.fromkeys(self.counts, 0)
+        dts = []
+
+        for entity in entities:
+
+            '''NEAR: EVERY STEP'''
+            if entity is focus or near_area.colliderect(entity.entity_hitbox):
+                asleep.discard(entity)
+                woken.discard(entity)
+                counts['near'] += 1
+                dts.append(dt)
+
+            elif entity in woken:
+                woken.discard(entity)
+                counts['far'] += 1
+                dts.append(dt)
+
+            elif EntityScheduler._resting(entity):
+                asleep.add(entity)
+                counts['asleep'] += 1
+                dts.append(0.0)
+
+            else:
+                '''FAR: EVERY INTERVAL STEPS (STAGGERED BY THE ENTITY PHASE)'''
+                asleep.discard(entity)
+                counts['far'] += 1
+                phase = phases.setdefault(entity, len(phases))
+                dts.append(dt * interval if (step + phase) % interval == 0 else 0.0)
+
+        self.counts = counts
+        return dts
+
+    def wake(self, entity) -> None:
+        '''Updates a sleeping entity on the next step (it goes back to sleep if still at rest).'''
+
+        if entity in self.asleep:
+            self.asleep.discard(entity)
+            self._woken.add(entity)
+
+    def wake_rect(self, rect: pygame.Rect) -> None:
+        '''Wakes up the sleeping entities around rect (e.g. after the tiles under it changed).'''
+
+        area = rect.inflate(2, 2)
+        for entity in [entity for entity in self.asleep if area.colliderect(entity.entity_hitbox)]:
+            self.wake(entity)
+
+    @staticmethod
+    def _resting(entity) -> bool:
+        '''Whether an entity would not move if updated (standing still on the ground with no
+        input or action going on).'''
+
+        return (entity.on_ground and entity.velocity.x == 0 and entity.velocity.y == 0
+                and not entity.left_key and not entity.right_key
+                and not entity.is_dashing and not entity.is_attacking)
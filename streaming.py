@@ -0,0 +1,360 @@
+import pygame
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from contextlib import ExitStack
+from itertools import islice
+from assets import assets
+from background import Background
+from collision import SpatialGrid, merge_solid_cells
+from level import Level, Tile
+from profiler import profiler
+
+
+_MAGIC = b'JTSC'
+_HEADER = struct.Struct('<4sIIII')
+
+
+class ChunkStore:
+
+    def __init__(self, filename: str) -> None:
+        '''Read only access to a chunked level file (see ChunkStore.compile). The file is
+        memory mapped, so reading a chunk only touches the pages of that chunk.'''
+
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_cols, self.n_rows, self.chunk_tiles, self.n_layers = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f'{filename} is not a chunked level file')
+        self.n_chunk_cols = -(-self.n_cols // self.chunk_tiles)
+        self.n_chunk_rows = -(-self.n_rows // self.chunk_tiles)
+        self._layer_bytes = self.chunk_tiles * self.chunk_tiles * 2
+
+    def read(self, chunk_col: int, chunk_row: int) -> list:
+        '''Returns the packed tile grid (chunk_tiles x chunk_tiles, row major, -1 for empty or
+        out of level cells) of every layer of a chunk.'''
+
+        offset = _HEADER.size + (chunk_row * self.n_chunk_cols + chunk_col) * self.n_layers * self._layer_bytes
+        grids = []
+        for _ in range(self.n_layers):
+            grid = array('h')
+            grid.frombytes(self._map[offset:offset + self._layer_bytes])
+            grids.append(grid)
+            offset += self._layer_bytes
+        return grids
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    @staticmethod
+    def compile(level: dict, filename: str, chunk_tiles: int) -> None:
+        '''Converts the layer csv files of a level into a chunked level file. The csv files are
+        read one band of chunk_tiles rows at a time, so compiling never holds the whole map.'''
+
+        n_cols, n_rows = level['size_in_tiles']
+        n_chunk_cols = -(-n_cols // chunk_tiles)
+        empty_row = [-1] * (n_chunk_cols * chunk_tiles)
+
+        with ExitStack() as files, open(filename + '.tmp', 'wb') as data:
+            readers = [csv.reader(files.enter_context(open(layer['mapping']))) for layer in level['layers']]
+            data.write(_HEADER.pack(_MAGIC, n_cols, n_rows, chunk_tiles, len(readers)))
+            for _ in range(0, n_rows, chunk_tiles):
+
+                '''READ ONE BAND OF ROWS PER LAYER (PADDED WITH EMPTY CELLS)'''
+                bands = []
+                for reader in readers:
+                    band = [[int(cell) for cell in row] + empty_row[len(row):] for row in islice(reader, chunk_tiles)]
+                    bands.append(band + [empty_row] * (chunk_tiles - len(band)))
+
+                '''WRITE THE BAND CHUNKS (LEFT TO RIGHT, ALL LAYERS OF A CHUNK TOGETHER)'''
+                for chunk_col in range(n_chunk_cols):
+                    first = chunk_col * chunk_tiles
+                    for band in bands:
+                        data.write(array('h', [cell for row in band for cell in row[first:first + chunk_tiles]]).tobytes())
+        os.replace(filename + '.tmp', filename)
+
+
+class _Chunk:
+
+    __slots__ = ('grids', 'tiles_per_layer', 'colliders', 'surface')
+
+    def __init__(self, grids: list, tiles_per_layer: list, colliders: list, surface: pygame.Surface) -> None:
+        self.grids = grids
+        self.tiles_per_layer = tiles_per_layer
+        self.colliders = colliders
+        self.surface = surface
+
+
+class StreamingLevel(Level):
+
+    load_margin = 1   # chunks kept loaded around the focus area
+    lookahead = 2     # extra chunks loaded ahead of the direction of travel
+
+    def __init__(self,
+                 config: dict,
+                 level_name: str,
+                 print_load_message: bool = False,
+                 render_bg: bool = False,
+                 prepared: tuple = None,
+                 deferred: bool = False) -> None:
+        '''Level that keeps only the chunks near the player in memory (tiles, colliders and
+        pre-rendered chunk surface). The map is compiled once into a chunked file in the level
+        cache and chunks are read from it on demand by stream(), which Game.update calls every
+        step. Chunks far from the focus are evicted. See Level for prepared and deferred.
+        Tile edits are kept per chunk and applied again when an evicted chunk is reloaded.'''
+
+        self._edits = {}
+        super().__init__(config, level_name, print_load_message, render_bg, prepared, deferred)
+
+    @staticmethod
+    def prepare(config: dict, level_name: str, render_bg: bool = False) -> tuple:
+        '''Compiles the chunked level file if needed and reads the background images if
+        render_bg. Returns (file name, cache hit, background images). Does not touch the display
+        or the shared assets, so it can run on a worker thread.'''
+
+        filename = StreamingLevel._chunk_file(config, level_name)
+        cache_hit = os.path.exists(filename)
+        if not cache_hit:
+            ChunkStore.compile(config[level_name], filename, Level.chunk_size_in_tiles)
+
+            '''REMOVE THE OLDER CHUNKED FILES OF THE SAME LEVEL (OTHER SETTINGS OR CSV CONTENT)'''
+            cache_dir = os.path.dirname(filename)
+            for name in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, name)
+                if name.startswith(f'{level_name}-') and name.endswith('.chunks') and path != filename:
+                    os.remove(path)
+        return filename, cache_hit, Background.prepare(config, level_name) if render_bg else None
+
+    def load_steps(self):
+        '''Opens the chunked level file, acquires the shared assets and loads the chunks around
+        the level origin (a generator, see Level.load_steps).'''
+
+        filename, self.cache_hit, backgrounds = self._prepared
+        self.store = ChunkStore(filename)
+        self.n_cols, self.n_rows = self.store.n_cols, self.store.n_rows
+        self.size_in_pixels = (self.n_cols*self.tile_size, self.n_rows*self.tile_size)
+        self.chunk_size = self.store.chunk_tiles * self.tile_size
+        self.chunks = {}
+        self.collision_grid = SpatialGrid(cell_size=self.tile_size)
+
+        '''SHARED LAYER SPRITESHEETS AND BACKGROUND'''
+        for layer in self.level['layers']:
+            self.spritesheets.append(assets.spritesheet(filename=layer['sp'],
+                                                        tile_size=(self.original_tile_size,self.original_tile_size),
+                                                        scale=self.scale,
+                                                        dimension=(layer['sp_w'],layer['sp_h']),
+                                                        alpha=layer.get('alpha', False)))
+            yield
+        if self.render_bg:
+            self.background = Background(self.config, self.level_name, backgrounds)
+            yield
+
+        '''LOAD THE CHUNKS AROUND THE SCREEN AT THE LEVEL ORIGIN (ONE CHUNK PER STEP)'''
+        screen_size = (self.config['display']['base-size'] * self.scale * self.config['game']['ntiles_width'],
+                       self.config['display']['base-size'] * self.scale * self.config['game']['ntiles_height'])
+        first_col, last_col, first_row, last_row = self._chunk_range(pygame.Rect((0, 0), screen_size),
+                                                                     pygame.math.Vector2(0, 0))
+        for row in range(max(first_row, 0), min(last_row, self.store.n_chunk_rows - 1) + 1):
+            for col in range(max(first_col, 0), min(last_col, self.store.n_chunk_cols - 1) + 1):
+                self._load_chunk(col, row)
+                yield
+        self._finish_loading()
+
+    def stream(self, focus: pygame.Rect, velocity) -> None:
+        '''Loads the chunks overlapping the focus area (plus a margin and a lookahead towards
+        velocity) and evicts the loaded chunks that are far from it.'''
+
+        first_col, last_col, first_row, last_row = self._chunk_range(focus, velocity)
+        for row in range(max(first_row, 0), min(last_row, self.store.n_chunk_rows - 1) + 1):
+            for col in range(max(first_col, 0), min(last_col, self.store.n_chunk_cols - 1) + 1):
+                if (col, row) not in self.chunks:
+                    self._load_chunk(col, row)
+
+        '''EVICT (WITH LOOKAHEAD + 1 CHUNKS OF HYSTERESIS SO CHUNKS DO NOT THRASH ON BORDERS
+        OR WHEN THE DIRECTION OF TRAVEL CHANGES)'''
+        keep = self.lookahead + 1
+        for col, row in [coord for coord in self.chunks
+                         if not (first_col - keep <= coord[0] <= last_col + keep
+                                 and first_row - keep <= coord[1] <= last_row + keep)]:
+            self._evict_chunk(col, row)
+
+    def is_loaded(self, rect: pygame.Rect) -> bool:
+        '''Returns whether every chunk overlapped by rect is loaded (entities outside the loaded
+        chunks have no colliders around them, so they are not updated).'''
+
+        size = self.chunk_size
+        for row in range(max(rect.top // size, 0), min((rect.bottom - 1) // size, self.store.n_chunk_rows - 1) + 1):
+            for col in range(max(rect.left // size, 0), min((rect.right - 1) // size, self.store.n_chunk_cols - 1) + 1):
+                if (col, row) not in self.chunks:
+                    return False
+        return True
+
+    def apply_edits(self) -> list:
+        '''Applies the queued tile edits (see Level.apply_edits). Edits of chunks that are not
+        loaded are only stored until the chunk is loaded.'''
+
+        if not self.pending_edits:
+            return []
+        edits, self.pending_edits = self.pending_edits, {}
+        size, chunk_tiles = self.tile_size, self.store.chunk_tiles
+        collision_layer = self.store.n_layers - 1
+        cells, collision_chunks = set(), set()
+
+        for (layer, col, row), tile_id in edits.items():
+            key, index = (col // chunk_tiles, row // chunk_tiles), (row % chunk_tiles) * chunk_tiles + col % chunk_tiles
+            self._edits.setdefault(key, {})[(layer, index)] = tile_id
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            chunk.grids[layer][index] = tile_id
+            chunk.tiles_per_layer[layer][index] = (Tile(col * size, row * size, self.spritesheets[layer].textures[tile_id])
+                                                   if tile_id != -1 else None)
+            cells.add((col, row))
+            if layer == collision_layer:
+                collision_chunks.add(key)
+
+        '''RENDER THE EDITED CELLS AND MERGE THE EDITED CHUNKS AGAIN'''
+        rects = []
+        for col, row in cells:
+            key = (col // chunk_tiles, row // chunk_tiles)
+            rect = pygame.Rect(col * size, row * size, size, size)
+            Level._render_cell(self.chunks[key].surface, self.chunks[key].tiles_per_layer,
+                               (row % chunk_tiles) * chunk_tiles + col % chunk_tiles,
+                               rect, (key[0] * self.chunk_size, key[1] * self.chunk_size))
+            rects.append(rect)
+        for col, row in collision_chunks:
+            chunk = self.chunks[(col, row)]
+            for collider in chunk.colliders:
+                self.collision_grid.remove(collider)
+            chunk.colliders = self._merge_colliders(chunk.grids[-1], col, row)
+        return rects
+
+    def collision_tile(self, col: int, row: int) -> int:
+        '''Returns the tile id of a cell of the collision layer (-1 if empty, outside the level or
+        in a chunk that is not loaded).'''
+
+        chunk_tiles = self.store.chunk_tiles
+        chunk = self.chunks.get((col // chunk_tiles, row // chunk_tiles))
+        if chunk is None or not (0 <= col < self.n_cols and 0 <= row < self.n_rows):
+            return -1
+        return chunk.grids[-1][(row % chunk_tiles) * chunk_tiles + col % chunk_tiles]
+
+    def collision_layer(self):
+        '''Only the chunks around the player are loaded, so there is no whole level grid.'''
+
+        return None
+
+    def render(self, screen, camera, area: pygame.Rect = None) -> None:
+        '''Renders the background and the chunks that intersect the camera viewport (visible
+        chunks that are not loaded yet are loaded right away). See Level.render for area.'''
+
+        if self.background is not None:
+            self.background.render(screen, camera, area)
+
+        size = self.chunk_size
+        first_col, last_col, first_row, last_row = self._visible_chunks(camera, area,
+                                                                        self.store.n_chunk_cols,
+                                                                        self.store.n_chunk_rows)
+
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                chunk = self.chunks.get((col, row)) or self._load_chunk(col, row)
+                screen.blit(chunk.surface, (col*size - camera.offset.x, row*size - camera.offset.y))
+        if profiler.enabled:
+            profiler.count('blits', max(last_row - first_row + 1, 0) * max(last_col - first_col + 1, 0))
+
+    def unload(self) -> None:
+        '''Evicts every chunk, closes the chunked file and releases the shared assets.'''
+
+        for col, row in list(self.chunks):
+            self._evict_chunk(col, row)
+        self.store.close()
+        super().unload()
+
+    def _chunk_range(self, focus: pygame.Rect, velocity) -> tuple:
+        '''Returns the (first_col, last_col, first_row, last_row) chunks (not clamped to the
+        level) overlapping the focus area plus the margin and the lookahead towards velocity.'''
+
+        size = self.chunk_size
+        first_col, last_col = focus.left // size - self.load_margin, (focus.right - 1) // size + self.load_margin
+        first_row, last_row = focus.top // size - self.load_margin, (focus.bottom - 1) // size + self.load_margin
+
+        '''LOOK AHEAD IN THE DIRECTION OF TRAVEL'''
+        if velocity.x > 0:
+            last_col += self.lookahead
+        elif velocity.x < 0:
+            first_col -= self.lookahead
+        if velocity.y > 0:
+            last_row += self.lookahead
+        elif velocity.y < 0:
+            first_row -= self.lookahead
+        return first_col, last_col, first_row, last_row
+
+    def _load_chunk(self, col: int, row: int) -> _Chunk:
+        '''Reads a chunk from the file, builds its tiles and colliders and pre-renders it.'''
+
+        size, tile_size, chunk_tiles = self.chunk_size, self.tile_size, self.store.chunk_tiles
+        x, y = col * size, row * size
+        surface = pygame.Surface(size=(min(size, self.size_in_pixels[0] - x), min(size, self.size_in_pixels[1] - y)))
+        surface.set_colorkey((0,0,0))
+
+        '''TILE GRIDS OF EVERY LAYER (WITH THE TILE EDITS OF THE CHUNK APPLIED)'''
+        grids = self.store.read(col, row)
+        for (layer, index), tile_id in self._edits.get((col, row), {}).items():
+            grids[layer][index] = tile_id
+
+        '''TILES OF EVERY LAYER (ONE ENTRY PER CELL, NONE FOR EMPTY CELLS), RENDERED TO THE CHUNK SURFACE'''
+        tiles_per_layer = []
+        for spritesheet, grid in zip(self.spritesheets, grids):
+            tiles = []
+            for i in range(chunk_tiles):
+                for j in range(chunk_tiles):
+                    tile_id = grid[i*chunk_tiles + j]
+                    if tile_id != -1:
+                        tile = Tile(x + j*tile_size, y + i*tile_size, spritesheet.textures[tile_id])
+                        tile.render(surface, offset=(x, y))
+                        tiles.append(tile)
+                    else:
+                        tiles.append(None)
+            tiles_per_layer.append(tiles)
+
+        chunk = _Chunk(grids, tiles_per_layer, self._merge_colliders(grids[-1], col, row), surface)
+        self.chunks[(col, row)] = chunk
+        return chunk
+
+    def _merge_colliders(self, grid: array, col: int, row: int) -> list:
+        '''Merges the solid cells of the collision layer grid of a chunk (colliders never cross
+        the chunk) and adds them to the collision grid. Returns them.'''
+
+        chunk_tiles = self.store.chunk_tiles
+        colliders = merge_solid_cells(grid, chunk_tiles, chunk_tiles, self.tile_size)
+        for collider in colliders:
+            collider.rect.move_ip(col * self.chunk_size, row * self.chunk_size)
+            self.collision_grid.insert(collider)
+        return colliders
+
+    def _evict_chunk(self, col: int, row: int) -> None:
+        chunk = self.chunks.pop((col, row))
+        for collider in chunk.colliders:
+            self.collision_grid.remove(collider)
+
+    @staticmethod
+    def _chunk_file(config: dict, level_name: str) -> str:
+        '''Returns the chunked file path of the level, keyed by a hash of the level settings
+        and of its csv files.'''
+
+        level = config[level_name]
+        digest = hashlib.sha1()
+        digest.update(json.dumps([level, Level.chunk_size_in_tiles], sort_keys=True).encode())
+        for layer in level['layers']:
+            with open(layer['mapping'], 'rb') as data:
+                for block in iter(lambda: data.read(2**20), b''):
+                    digest.update(block)
+        cache_dir = config['game']['level-cache'] or '.'
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, f'{level_name}-{digest.hexdigest()}.chunks')
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pygame
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    '''Runs every test from the repository root (settings and assets paths are relative to it).'''
+
+    monkeypatch.chdir(ROOT)
+    pygame.init()
+    yield
+
+
+@pytest.fixture
+def config():
+    import json
+    with open(os.path.join(ROOT, 'settings.json')) as json_file:
+        return json.load(json_file)
@@ -0,0 +1,16 @@
+import random
+
+import pygame
+
+from collision import sweep_and_prune
+
+
+def test_sweep_and_prune_finds_every_overlapping_pair_once():
+    rng = random.Random(0)
+    for _ in range(100):
+        n = rng.randrange(0, 40)
+        query = [pygame.Rect(rng.randrange(500), rng.randrange(200), rng.randrange(80), rng.randrange(80)) for _ in range(n)]
+        target = [pygame.Rect(rng.randrange(500), rng.randrange(200), rng.randrange(80), rng.randrange(80)) for _ in range(n)]
+        pairs = list(sweep_and_prune(query, target))
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == {(i, j) for i in range(n) for j in range(n) if query[i].colliderect(target[j])}
@@ -0,0 +1,100 @@
+import pygame
+import pytest
+
+from game import Game
+from level import Level
+from streaming import StreamingLevel
+import benchmark
+
+
+def load_level(config, level_name='level-test'):
+    config['game']['level-cache'] = None
+    game = Game(config=config, headless=True)
+    game.load_map(level_name, render_bg=False)
+    return game.level
+
+
+def solid_cell(level):
+    grid = level.grid_per_layer[-1]
+    index = next(i for i, tile_id in enumerate(grid) if tile_id != -1)
+    return index % level.n_cols, index // level.n_cols
+
+
+def colliders_at(level, col, row):
+    cell = pygame.Rect(col * level.tile_size, row * level.tile_size, level.tile_size, level.tile_size)
+    return [collider for collider in level.collision_grid.query(cell) if collider.rect.colliderect(cell)]
+
+
+def test_edit_on_layer_minus_one_updates_the_colliders(config):
+    level = load_level(config)
+    col, row = solid_cell(level)
+    assert colliders_at(level, col, row)
+
+    level.set_tile(-1, col, row, -1)
+    level.apply_edits()
+    assert level.collision_tile(col, row) == -1
+    assert not colliders_at(level, col, row)
+
+    level.set_tile(-1, col, row, 1)
+    level.apply_edits()
+    assert colliders_at(level, col, row)
+
+
+def test_invalid_edits_are_rejected_before_being_queued(config):
+    level = load_level(config)
+    n_textures = len(level.spritesheets[0].textures)
+    for layer, tile_id in ((0, n_textures), (0, -2), (1, 0), (-2, 0)):
+        with pytest.raises(IndexError):
+            level.set_tile(layer, 1, 1, tile_id)
+    assert level.pending_edits == {}
+
+
+def test_streaming_level_rejects_unknown_tile_ids(config, tmp_path):
+    csv_filename = str(tmp_path / 'bench.csv')
+    benchmark.make_level_csv(csv_filename, 64, 16)
+    config = benchmark.make_config(config, csv_filename, 64, 16, 'scalar', streaming=True)
+    game = Game(config=config, headless=True)
+    game.load_map('bench', render_bg=False)
+    assert isinstance(game.level, StreamingLevel)
+    with pytest.raises(IndexError):
+        game.level.set_tile(0, 1, 1, 999)
+    game.level.set_tile(-1, 1, 1, 1)
+    assert game.level.pending_edits == {(0, 1, 1): 1}
+    game.level.unload()
+
+
+def all_colliders(level):
+    return level.collision_grid.query(pygame.Rect(0, 0, level.n_cols * level.tile_size, level.n_rows * level.tile_size))
+
+
+def test_editing_a_long_floor_only_touches_the_colliders_near_the_edit(config, tmp_path):
+    n_cols = 1000
+    csv_filename = str(tmp_path / 'floor.csv')
+    with open(csv_filename, 'w') as data:
+        data.write('\n'.join(','.join(['-1' if row < 2 else '1'] * n_cols) for row in range(4)) + '\n')
+    config = benchmark.make_config(config, csv_filename, n_cols, 4, 'scalar', streaming=False)
+    config['display']['scale'] = 1
+    game = Game(config=config, headless=True)
+    game.load_map('bench', render_bg=False)
+    level, size = game.level, game.level.tile_size
+
+    before = all_colliders(level)
+    assert max(collider.rect.w for collider in before) <= Level.max_collider_tiles * size
+
+    level.set_tile(-1, 500, 2, -1)
+    level.apply_edits()
+    after = all_colliders(level)
+
+    '''ONLY THE COLLIDERS OVERLAPPING THE 3X3 WINDOW OF THE EDIT ARE REPLACED'''
+    window = pygame.Rect(499 * size, 1 * size, 3 * size, 3 * size)
+    assert {collider for collider in before if not collider.rect.colliderect(window)} <= set(after)
+    touched = [collider.rect for collider in set(after) - set(before)]
+    reach = window.inflate(2 * Level.max_collider_tiles * size, 2 * Level.max_collider_tiles * size)
+    assert touched and all(reach.contains(rect) for rect in touched)
+
+    '''THE COLLIDERS COVER EXACTLY THE SOLID CELLS, ONCE'''
+    covered = [(x // size + i, y // size + j)
+               for x, y, w, h in (collider.rect for collider in after)
+               for i in range(w // size) for j in range(h // size)]
+    solid = [(col, row) for row in range(level.n_rows) for col in range(n_cols) if level.collision_tile(col, row) != -1]
+    assert sorted(covered) == sorted(solid)
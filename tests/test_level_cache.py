@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import level_cache
+from level import Level
+
+
+@pytest.fixture
+def cached_level(config, tmp_path):
+    config['game']['level-cache'] = str(tmp_path)
+    key = level_cache.cache_key(config, 'level-test')
+    Level.prepare(config, 'level-test')
+    return config, key, level_cache.cache_path(str(tmp_path), 'level-test', key)
+
+
+def test_cached_level_loads(cached_level, tmp_path):
+    config, key, path = cached_level
+    compiled = level_cache.load(str(tmp_path), 'level-test', key)
+    assert (compiled.n_cols, compiled.n_rows) == tuple(config['level-test']['size_in_tiles'])
+
+
+@pytest.mark.parametrize('size', [6, 12, 200, -1])
+def test_truncated_cache_file_is_a_miss_and_gets_rebuilt(cached_level, tmp_path, size):
+    config, key, path = cached_level
+    with open(path, 'rb') as data:
+        blob = data.read()
+    with open(path, 'wb') as data:
+        data.write(blob[:size])
+
+    assert level_cache.load(str(tmp_path), 'level-test', key) is None
+    compiled, cache_hit, _ = Level.prepare(config, 'level-test')
+    assert not cache_hit
+    assert os.path.getsize(path) == len(blob)
+    assert level_cache.load(str(tmp_path), 'level-test', key) is not None
@@ -0,0 +1,23 @@
+import benchmark
+
+
+def run(config, csv_filename, physics, n_steps=240):
+    config = benchmark.make_config(config, csv_filename, 250, 20, physics, streaming=False)
+    game, _ = benchmark.build_game(config, n_entities=30)
+    for entity in game.group[1:]:
+        entity.right_key = True   # keep them moving, so the far ones are not put to sleep
+    for _ in range(n_steps):
+        game.update()
+    return [tuple(entity.position) for entity in game.group]
+
+
+def test_scalar_and_numpy_backends_match_with_the_scheduler(config, tmp_path):
+    csv_filename = str(tmp_path / 'bench.csv')
+    benchmark.make_level_csv(csv_filename, 250, 20)
+    config['game']['entity-scheduler'] = True
+    config['game']['far-update-interval'] = 4
+
+    scalar, batch = run(config, csv_filename, 'scalar'), run(config, csv_filename, 'numpy')
+    assert len(scalar) == len(batch)
+    for a, b in zip(scalar, batch):
+        assert abs(a[0] - b[0]) < 1e-6 and abs(a[1] - b[1]) < 1e-6
@@ -0,0 +1,37 @@
+import pygame
+
+from game import Game
+
+
+def press(game, key, down=True):
+    game.player.control(pygame.event.Event(pygame.KEYDOWN if down else pygame.KEYUP, key=key))
+
+
+def step(game, n=1):
+    for _ in range(n):
+        game.update()
+        game.render()
+
+
+def test_attacking_again_while_retracting_recovers(config):
+    config['game']['level-cache'] = None
+    game = Game(config=config, headless=True)
+    game.load_map('level-test', render_bg=False)
+    player = game.player
+    step(game, 30)
+
+    press(game, pygame.K_f)
+    for _ in range(120):
+        step(game)
+        if player.trigger_deatk_anim:
+            break
+    assert player.trigger_deatk_anim and not player.trigger_atk_anim
+
+    press(game, pygame.K_f, down=False)
+    press(game, pygame.K_f)
+    assert player.trigger_atk_anim and not player.trigger_deatk_anim
+    press(game, pygame.K_f, down=False)
+
+    step(game, 180)
+    assert not player.trigger_atk_anim and not player.trigger_deatk_anim
+    assert player.atk_hitbox.w == player.entity_hitbox.w
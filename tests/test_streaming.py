@@ -0,0 +1,28 @@
+import os
+
+import benchmark
+from streaming import StreamingLevel
+
+
+def test_numpy_backend_freezes_entities_outside_loaded_chunks(config, tmp_path):
+    csv_filename = str(tmp_path / 'bench.csv')
+    benchmark.make_level_csv(csv_filename, 250, 20)
+    config = benchmark.make_config(config, csv_filename, 250, 20, 'numpy', streaming=True)
+    game, _ = benchmark.build_game(config, n_entities=40)
+
+    for _ in range(120):
+        game.update()
+
+    bottom = game.level.n_rows * game.level.tile_size
+    assert all(entity.entity_hitbox.top < bottom for entity in game.group)
+    game.level.unload()
+
+
+def test_compiling_a_chunked_file_removes_the_stale_ones(config, tmp_path):
+    csv_filename = str(tmp_path / 'bench.csv')
+    config = benchmark.make_config(config, csv_filename, 64, 16, 'scalar', streaming=True)
+    for seed in (0, 1):
+        benchmark.make_level_csv(csv_filename, 64, 16, seed=seed)
+        filename, cache_hit, _ = StreamingLevel.prepare(config, 'bench')
+        assert not cache_hit
+    assert [path.name for path in tmp_path.glob('*.chunks')] == [os.path.basename(filename)]
@@ -9,39 +9,97 @@ class SpriteSheet:
                  filename: str,
                  tile_size: tuple[int, int],
                  scale: int,
-                 dimension: tuple[int, int]) -> None:
+                 dimension: tuple[int, int],
+                 flippable: bool = False,
+                 atlas: pygame.Surface = None,
+                 alpha: bool = False) -> None:
         '''Creates an object that handles a given sprite sheet. Contains methods to locate and
-        load all its textures and add them to a pygame surfaces list.'''
+        load all its textures and add them to a pygame surfaces list.
+        The sheet is scaled once into a single atlas surface and every texture is a subsurface
+        (a view, no pixel copy) of it.
+        If flippable, the horizontally flipped atlas is also created once, so the renderers can
+        look the flipped textures up with get(index, flip_x) instead of flipping every frame.
+        If an atlas (already scaled textures laid out as in the file, see scale_atlas) is given,
+        the file is not read and the textures are sliced from the atlas (converted to the display
+        format) without rescaling.
+        If alpha, the sheet keeps its per pixel transparency (convert_alpha) instead of using
+        black as the transparent colorkey.'''
 
         self._filename = filename
         self._tile_size = tile_size
         self._scale = scale
         self._dimension = dimension
-        self._sprite_sheet = pygame.image.load(filename).convert()
+        self._flippable = flippable
+        self._alpha = alpha
         self.textures = []
-        self.load()
+        self.flipped_textures = []
+        self.atlas = None
+        self.flipped_atlas = None
+        if atlas is None:
+            self.load()
+        else:
+            self._load_from_atlas(atlas.convert_alpha() if alpha else atlas.convert())
 
-    def _get_texture(self, x_pos: int, y_pos: int, texture_width: int, texture_height: int) -> pygame.Surface:
-        '''Gets the texture from the spritesheet file and return it as a textured surface.
-        x_pos and y_pos are the positions of the left upper vertice in relation to the spritesheet file
-        (not the final position in the window -> this is done by a TileMap object)'''
+    def get(self, index: int, flip_x: bool = False) -> pygame.Surface:
+        '''Returns a loaded texture, horizontally flipped if flip_x (needs a flippable sheet).'''
 
-        texture = pygame.Surface(size=(texture_width, texture_height))
-        texture.set_colorkey((0, 0, 0))
-        texture.blit(source=self._sprite_sheet,
-                     dest=(0, 0),
-                     area=(x_pos, y_pos, texture_width, texture_height))
-        return texture
+        if flip_x:
+            return self.flipped_textures[index]
+        return self.textures[index]
 
     def load(self):
-        '''Loads all textures from spritesheet to a list of textures.'''
+        '''Loads the spritesheet file, scales the used part of it into the atlas and slices
+        all textures from it.'''
 
-        for y in range(0, self._dimension[0]):
-            for x in range(0, self._dimension[1]):
-                self.textures.append(pygame.transform.scale(self._get_texture(x * self._tile_size[0],
-                                                                              y * self._tile_size[1],
-                                                                              self._tile_size[0],
-                                                                              self._tile_size[1]),
-                                                            (self._tile_size[0] * self._scale,
-                                                             self._tile_size[1] * self._scale)))
+        atlas = SpriteSheet.scale_atlas(self._filename, self._tile_size, self._scale, self._dimension, self._alpha)
+        self._load_from_atlas(atlas.convert_alpha() if self._alpha else atlas.convert())
 
+    @staticmethod
+    def scale_atlas(filename: str,
+                    tile_size: tuple[int, int],
+                    scale: int,
+                    dimension: tuple[int, int],
+                    alpha: bool = False) -> pygame.Surface:
+        '''Reads a spritesheet file and returns the used part of it scaled into an atlas, not
+        converted to the display format (so it can run off the main thread, see loader.py).'''
+
+        sheet = pygame.image.load(filename)
+
+        '''CROP (OR PAD, IF THE FILE IS SMALLER THAN THE DIMENSIONS) THE USED PART OF THE SHEET'''
+        width, height = tile_size[0] * dimension[1], tile_size[1] * dimension[0]
+        if sheet.get_width() >= width and sheet.get_height() >= height:
+            region = sheet.subsurface((0, 0, width, height))
+        else:
+            region = pygame.Surface(size=(width, height), flags=pygame.SRCALPHA, depth=32)
+            region.blit(sheet, (0, 0), special_flags=pygame.BLEND_RGBA_MAX)  # plain copy, no blending
+
+        '''SCALE ALL TEXTURES AT ONCE (NEAREST NEIGHBOUR, SAME PIXELS AS SCALING EACH ONE)'''
+        return pygame.transform.scale(region, (width * scale, height * scale))
+
+    def _load_from_atlas(self, atlas: pygame.Surface) -> None:
+        '''Slices all textures from an already scaled atlas.'''
+
+        self.atlas = atlas
+        if not self._alpha:
+            self.atlas.set_colorkey((0, 0, 0))
+        self.textures = self._slice(self.atlas)
+
+        '''CACHE FLIPPED TEXTURES (LEFT FACING SPRITES). FLIPPING THE WHOLE ATLAS MIRRORS THE
+        COLUMNS, SO THE FLIPPED TEXTURES ARE SLICED BACKWARDS ON EACH ROW'''
+        if self._flippable:
+            self.flipped_atlas = pygame.transform.flip(self.atlas, flip_x=True, flip_y=False)
+            if not self._alpha:
+                self.flipped_atlas.set_colorkey((0, 0, 0))
+            self.flipped_textures = self._slice(self.flipped_atlas, mirrored=True)
+
+    def _slice(self, atlas: pygame.Surface, mirrored: bool = False) -> list:
+        '''Returns subsurfaces of the atlas for every texture (row major order).'''
+
+        width, height = self._tile_size[0] * self._scale, self._tile_size[1] * self._scale
+        n_rows, n_cols = self._dimension
+        textures = []
+        for y in range(0, n_rows):
+            for x in range(0, n_cols):
+                col = n_cols - 1 - x if mirrored else x
+                textures.append(atlas.subsurface((col * width, y * height, width, height)))
+        return textures
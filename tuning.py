@@ -0,0 +1,230 @@
+import pygame
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+'''TUNABLE PARAMETERS: PLAYER STATS (SEE Entity.__init__) AND LEVEL PHYSICS'''
+ENTITY_STATS = ('jump_force', 'dash_force', 'jumpX_velocity', 'jump_control', 'walk_accel', 'run_boost',
+                'max_x_velocity', 'max_y_velocity', 'mass', 'slipperiness')
+LEVEL_PHYSICS = ('gravity', 'friction')
+
+'''SCRIPTED INPUTS, IN THE RECORDING FORMAT OF replay.InputRecorder (STEP, EVENT TYPE, KEY).
+STEPS COUNT FROM THE FIRST LANDING OF THE PLAYER (IT SPAWNS IN THE AIR)'''
+SCRIPTS = {
+    'walk': {'steps': 150, 'events': [[0, 'KEYDOWN', pygame.K_RIGHT]]},
+    'run': {'steps': 150, 'events': [[0, 'KEYDOWN', pygame.K_z], [0, 'KEYDOWN', pygame.K_RIGHT]]},
+    'jump': {'steps': 150, 'events': [[0, 'KEYDOWN', pygame.K_SPACE], [60, 'KEYUP', pygame.K_SPACE]]},
+    'short-jump': {'steps': 150, 'events': [[0, 'KEYDOWN', pygame.K_SPACE], [6, 'KEYUP', pygame.K_SPACE]]},
+    'running-jump': {'steps': 210, 'events': [[0, 'KEYDOWN', pygame.K_z], [0, 'KEYDOWN', pygame.K_RIGHT],
+                                              [60, 'KEYDOWN', pygame.K_SPACE], [120, 'KEYUP', pygame.K_SPACE]]},
+}
+
+METRICS = ('jump_height', 'air_time', 'distance', 'top_speed', 'time_to_top_speed')
+
+
+def make_flat_level(config: dict, directory: str, n_cols: int = 400, n_rows: int = 15) -> dict:
+    '''Returns a copy of the settings with a "bench" level (see benchmark.make_config) that is
+    only a flat floor, so ledges and platforms do not disturb the metrics.'''
+
+    from benchmark import make_config
+    csv_filename = os.path.join(directory, 'flat.csv')
+    with open(csv_filename, 'w') as data:
+        for row in range(n_rows):
+            tile_id = {n_rows - 2: 1, n_rows - 1: 4}.get(row, -1)
+            data.write(','.join([str(tile_id)] * n_cols) + '\n')
+    return make_config(config, csv_filename, n_cols, n_rows, config['game']['physics-backend'], streaming=False)
+
+
+def grid_samples(ranges: dict) -> list:
+    '''Returns every combination of the given values, e.g. {"jump_force": [10, 12]}.'''
+
+    names = list(ranges)
+    return [dict(zip(names, values)) for values in itertools.product(*(ranges[name] for name in names))]
+
+
+def random_samples(ranges: dict, n_samples: int, seed: int = 0) -> list:
+    '''Returns n_samples parameter sets drawn uniformly from the given (low, high) ranges.'''
+
+    rng = random.Random(seed)
+    return [{name: rng.uniform(low, high) for name, (low, high) in ranges.items()} for _ in range(n_samples)]
+
+
+'''WORKER PROCESS STATE (ONE HEADLESS GAME PER PROCESS, REUSED BY EVERY SIMULATION)'''
+_game = None
+
+
+def _init_worker(config: dict, level_name: str) -> None:
+    global _game
+    from game import Game
+    _game = Game(config=config, headless=True)
+    _game.load_map(level_name=level_name, render_bg=False)
+
+
+def simulate(params: dict, script: dict) -> dict:
+    '''Runs a scripted input sequence with the given parameters on a fresh player in the
+    worker game and returns the movement metrics (distances in pixels, times in seconds).'''
+
+    from player import Joel
+    from replay import RECORDED_EVENT_TYPES
+    game = _game
+
+    '''FRESH PLAYER WITH THE PARAMETERS APPLIED (THE LEVEL PHYSICS ARE APPLIED BY add_entity)'''
+    for entity in game.group:
+        entity.release_textures()
+    game.group = []
+    game.level.gravity = params.get('gravity', game.config[game.level.level_name]['physics']['gravity'])
+    game.level.friction = params.get('friction', game.config[game.level.level_name]['physics']['friction'])
+    player = Joel(game.config, init_x=64, init_y=0)
+    for name in ENTITY_STATS:
+        if name in params:
+            setattr(player, name, params[name])
+    game.player = player
+    game.spawn(player)
+
+    event_types = {name: event_type for event_type, name in RECORDED_EVENT_TYPES.items()}
+    events_per_step = {}
+    for step, event_type, key in script['events']:
+        events_per_step.setdefault(step, []).append(pygame.event.Event(event_types[event_type], key=key))
+
+    '''WAIT FOR THE LANDING (GIVE UP AFTER 10 SECONDS)'''
+    for _ in range(10 * game.fps):
+        if player.on_ground:
+            break
+        game.update()
+
+    '''RUN AND TRACK THE METRICS'''
+    start_x = player.position.x
+    takeoff_y, peak_y, takeoff_step, landing_step = None, None, None, None
+    speeds = []
+    was_on_ground = player.on_ground
+    for step in range(script['steps']):
+        for event in events_per_step.get(step, ()):
+            player.control(event)
+        game.update()
+
+        if takeoff_y is None and was_on_ground and not player.on_ground:
+            takeoff_y, peak_y, takeoff_step = player.position.y, player.position.y, step
+        if takeoff_y is not None and landing_step is None:
+            peak_y = min(peak_y, player.position.y)
+            if player.on_ground:
+                landing_step = step
+        was_on_ground = player.on_ground
+        speeds.append(abs(player.velocity.x))
+
+    top_speed = max(speeds)
+    time_to_top_speed = None
+    if top_speed > 0:
+        time_to_top_speed = next(step for step, speed in enumerate(speeds) if speed >= 0.95 * top_speed)
+        time_to_top_speed = (time_to_top_speed - (script['events'][0][0] if script['events'] else 0)) / game.fps
+    return {'jump_height': takeoff_y - peak_y if takeoff_y is not None else 0.0,
+            'air_time': ((landing_step if landing_step is not None else script['steps']) - takeoff_step) / game.fps
+                        if takeoff_step is not None else 0.0,
+            'distance': player.position.x - start_x,
+            'top_speed': top_speed,
+            'time_to_top_speed': time_to_top_speed}
+
+
+def run_case(params: dict, scripts: dict) -> dict:
+    '''Simulates every script with one parameter set.'''
+
+    return {'params': params,
+            'metrics': {name: simulate(params, script) for name, script in scripts.items()}}
+
+
+def tune(config: dict, level_name: str, samples: list, scripts: dict, workers: int = None) -> list:
+    '''Simulates every parameter set with every script over a process pool (one process per
+    core by default). Returns one result per parameter set, in order.'''
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config, level_name)) as executor:
+        chunksize = max(len(samples) // ((workers or os.cpu_count() or 1) * 4), 1)
+        return list(executor.map(run_case, samples, itertools.repeat(scripts), chunksize=chunksize))
+
+
+def _parse_ranges(specs: list, as_range: bool) -> dict:
+    '''Parses "name=v1,v2,..." (grid) or "name=low:high" (random) parameter specs.'''
+
+    ranges = {}
+    for spec in specs:
+        name, values = spec.split('=')
+        if name not in ENTITY_STATS + LEVEL_PHYSICS:
+            raise ValueError(f'unknown parameter {name} (tunable: {", ".join(ENTITY_STATS + LEVEL_PHYSICS)})')
+        ranges[name] = tuple(float(v) for v in values.split(':')) if as_range else [float(v) for v in values.split(',')]
+    return ranges
+
+
+def main() -> None:
+    '''Runs the parameter sweep, prints a table (first rows only for big sweeps) and saves all
+    the results as csv.'''
+
+    parser = argparse.ArgumentParser(description='Joel the Squid movement parameter tuning')
+    parser.add_argument('--grid', nargs='+', metavar='NAME=V1,V2', default=[],
+                        help='every combination of these values, e.g. jump_force=10,12,14 walk_accel=0.2,0.3')
+    parser.add_argument('--random', nargs='+', metavar='NAME=LOW:HIGH', default=[],
+                        help='uniform random samples in these ranges (see --samples)')
+    parser.add_argument('--samples', type=int, default=1000, help='number of random samples')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scripts', nargs='+', default=list(SCRIPTS), help='built in input scripts')
+    parser.add_argument('--recording', nargs='+', default=[], metavar='FILE',
+                        help='also use input recordings (see main.py --record) as scripts (their steps are '
+                             'counted from the first landing)')
+    parser.add_argument('--level', default='flat', help='level to simulate on ("flat" is a synthetic flat floor)')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per core)')
+    parser.add_argument('--out', default='tuning_results.csv')
+    args = parser.parse_args()
+
+    with open("settings.json") as json_file:
+        config = json.load(json_file)
+
+    '''PARAMETER SETS (THE DEFAULT STATS ONLY IF NO SPEC IS GIVEN)'''
+    samples = grid_samples(_parse_ranges(args.grid, as_range=False)) if args.grid else [{}]
+    if args.random:
+        samples = [dict(base, **sample) for base in samples
+                   for sample in random_samples(_parse_ranges(args.random, as_range=True), args.samples, args.seed)]
+
+    scripts = {name: SCRIPTS[name] for name in args.scripts}
+    for filename in args.recording:
+        with open(filename) as json_file:
+            scripts[os.path.basename(filename)] = json.load(json_file)
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.level == 'flat':
+            results = tune(make_flat_level(config, tmp_dir), 'bench', samples, scripts, args.workers)
+        else:
+            results = tune(config, args.level, samples, scripts, args.workers)
+    elapsed = time.perf_counter() - start_time
+    print(f'{len(samples)} parameter sets x {len(scripts)} scripts simulated in {elapsed:.1f} s')
+
+    '''ONE ROW PER (PARAMETER SET, SCRIPT)'''
+    names = sorted({name for sample in samples for name in sample})
+    rows = [dict(result['params'], script=script, **metrics)
+            for result in results for script, metrics in result['metrics'].items()]
+    print(' '.join(f'{name:>14}' for name in names + ['script'] + list(METRICS)))
+    for row in rows[:40]:
+        print(' '.join(f'{_format(row.get(name)):>14}' for name in names + ['script'] + list(METRICS)))
+    if len(rows) > 40:
+        print(f'... {len(rows) - 40} more rows')
+
+    with open(args.out, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=names + ['script'] + list(METRICS))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'results saved to {args.out}')
+
+
+def _format(value) -> str:
+    if value is None:
+        return '-'
+    return f'{value:.3f}' if isinstance(value, float) else str(value)
+
+
+if __name__ == '__main__':
+    main()